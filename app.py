@@ -1,16 +1,110 @@
-from flask import Flask, render_template, request, send_file, jsonify
+from flask import Flask, Response, g, render_template, request, send_from_directory, jsonify
 from src.utils.video_editor import VideoEditor
+from src.utils.asset_index import AssetIndex
 from src.services.render_count import RenderCountService
 from src.services.download_count import DownloadCountService
+from src.services.render_queue import RenderQueueService
+from src.services.render_task import (
+    BATCH_GROUP_SIZE,
+    find_cached,
+    render_batch,
+    render_preview,
+    render_video,
+    warm_up_worker,
+)
+from src.services.admission import (
+    AdmissionController,
+    estimate_batch_memory,
+    estimate_render_memory,
+    estimate_render_seconds,
+)
+from src.utils.segmented_render import segment_workers
+from src.utils.template_cache import video_duration
+from src.utils.frame_cache import loop_cache_bytes
+from src.utils.layout_plan import load_plan
+from src.utils.encoder_profiles import ENCODER_PROFILES
+from src.services import metrics
+from werkzeug.wsgi import wrap_file
+import io
 import os
+import json
 import time
+import uuid
 import random
-import glob
-import gc  # 添加 gc 模块导入
 
 app = Flask(__name__, template_folder="src/templates")
+# 前置支持X-Sendfile的服务器（如Apache的mod_xsendfile）时可开启，由前端服务器直接发送文件
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE") == "1"
 render_count_service = RenderCountService()
 download_count_service = DownloadCountService()
+admission_controller = AdmissionController()
+
+
+def on_render_finished(job):
+    """渲染任务结束：释放预留的内存并记录指标"""
+    admission_controller.release(job["admission_key"])
+    metrics.record_render_job(job)
+
+
+render_queue_service = RenderQueueService(
+    on_finished=on_render_finished, initializer=warm_up_worker
+)
+video_index = AssetIndex.for_directory("asset/video", VideoEditor.VIDEO_FORMATS)
+
+# 一次批量渲染请求最多包含的视频数量
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 500))
+# 批量渲染时查询任务状态的间隔（秒）
+BATCH_POLL_INTERVAL = 0.5
+# 任务进度事件流在没有更新时发送心跳的间隔（秒）
+EVENTS_KEEPALIVE = 15
+
+# 文字字段的最大长度和超出时的提示
+TEXT_LIMITS = (
+    ("shop_name", 20, "店名不能超过20个字符"),
+    ("left_comment", 120, "左侧评论不能超过120个字符"),
+    ("right_comment", 12, "右侧评论不能超过12个字符"),
+    ("bottom_comment", 100, "底部评论不能超过100个字符"),
+)
+
+
+def frame_cache_bytes(plan, template_duration, duration):
+    """输出时长超过模板时长时，循环播放缓存模板画面的字节数（模板已转码为24fps）"""
+    if duration <= template_duration:
+        return 0
+    return loop_cache_bytes(template_duration, 24, (plan.width, plan.height))
+
+
+def validate_texts(texts):
+    """检查文字长度，返回错误提示，全部合法时返回None"""
+    for name, limit, message in TEXT_LIMITS:
+        if len(texts[name]) > limit:
+            return message
+    return None
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+
+@app.after_request
+def record_request_duration(response):
+    started_at = g.pop("request_started_at", None)
+    if started_at is not None:
+        metrics.http_request_seconds.observe(
+            time.perf_counter() - started_at,
+            endpoint=request.endpoint or "unknown",
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
+
+
+@app.route("/metrics")
+def get_metrics():
+    return Response(
+        metrics.registry.render(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 @app.route("/")
@@ -27,202 +121,341 @@ def process():
         left_comment = request.form["left_comment"]
         right_comment = request.form["right_comment"]
         template_id = request.form["template_id"]
+        render_backend = request.form.get("render_backend", "moviepy")
+        encoder_profile = request.form.get("encoder_profile") or None
+        audio_id = request.form.get("audio_id") or None
+        seed = request.form.get("seed") or None
+        segmented = request.form.get("segmented", "") in ("1", "true", "on")
+        # 预览方式（still/clip），为空时渲染完整视频
+        preview = request.form.get("preview") or None
 
         # 验证输入文字长度
-        if len(shop_name) > 20:
-            return jsonify({"error": "店名不能超过20个字符"}), 400
-        if len(left_comment) > 120:
-            return jsonify({"error": "左侧评论不能超过120个字符"}), 400
-        if len(right_comment) > 12:
-            return jsonify({"error": "右侧评论不能超过12个字符"}), 400
-        if len(bottom_comment) > 100:
-            return jsonify({"error": "底部评论不能超过100个字符"}), 400
-
-        # 从视频目录选择视频
-        input_dir = "asset/video"  # 修改为使用统一的视频目录
-        video_path = VideoEditor.get_random_video(input_dir)
-
-        # 创建VideoEditor实例
-        editor = VideoEditor(video_path)
-
-        # 计算视频时长（基于打字机文字长度和静态文字显示需求）
-        typing_speed = 0.3  # 每个字符的打字速度（秒）
-        typing_duration = len(bottom_comment) * typing_speed + 3  # 加1秒作为开始延迟
-
-        # 获取视频总时长，如果打字机效果需要的时间更长，则通过循环来延长视频时长
-        original_duration = editor.video.duration
-        video_duration = max(original_duration, typing_duration)
-        if video_duration > original_duration:
-            editor.video = editor.video.loop(duration=video_duration)
-
-        # 先创建文字对象以获取尺寸
-        text_image = editor.create_text_image(shop_name, font_size=48, color="black")
-        text_width, text_height = text_image.size
-
-        # 添加title.png图片，根据文字宽度调整大小
-        # 设置最小宽度为原始宽度的一半，确保短文本时图片也有合适的大小
-        min_width = 402  # 原始宽度
-        img_width = max(min_width, text_width + 100)  # 文字宽度加上左右边距
-
-        # 添加title.png图片
-        editor.add_image(
-            "asset/images/title.png",
-            position=((1080 - img_width) // 2, 148),  # 水平居中
-            size=(img_width, None),  # 只设置宽度，保持原始比例
-            start_time=0,
-            end_time=video_duration,
-        )
-
-        # 添加店名文字（垂直居中）
-        title_height = 80  # title.png的高度
-        text_y = 148 + (title_height - text_height) // 2  # 计算垂直居中位置
-        editor.add_text(
-            shop_name,
-            position=((1080 - text_width) // 2, text_y),
-            font_size=48,
-            color="black",
-            start_time=0,
-            end_time=video_duration,
-        )
-
-        # 添加底部评论背景图片
-        editor.add_image(
-            "asset/images/bottom_evaluate.png",
-            position=(-120, 967),
-            size=(1300, 447),
-            start_time=0,
-            end_time=video_duration,
-        )
-
-        # 添加底部评论文字
-        # 处理底部评论的手动换行和自动换行
-        chars_per_line = 31
-        lines = bottom_comment.split("\n")  # 先按用户手动换行分割
-        formatted_lines = []
-
-        # 处理每一行，如果超过最大长度则自动换行
-        for line in lines:
-            while len(line) > chars_per_line:
-                formatted_lines.append(line[:chars_per_line])
-                line = line[chars_per_line:]
-            if line:  # 添加剩余的文字
-                formatted_lines.append(line)
-
-        bottom_comment = "\n".join(formatted_lines)
-        editor.add_text(
-            bottom_comment,
-            position=(60, 1080),
-            font_size=30,
-            color="black",
-            typewriter_effect=True,
-            typing_speed=typing_speed,
-            start_time=0.1,
-            end_time=video_duration,
-        )
-        # 添加底部好外卖名称
-        editor.add_text(
-            "——好外卖分部",
-            position=(590, 1240),
-            font_size=62,
-            color="red",
-            start_time=0,  # 从视频开始就显示
-            end_time=video_duration,
-        )  # 修改为视频总时长
-
-        # 添加左侧评论背景图片
-        editor.add_image(
-            "asset/images/five_star.png",
-            position=(14, 342),
-            start_time=0,
-            end_time=video_duration,
-        )
-
-        # 添加左侧评论文字
-        editor.add_text(
-            left_comment,
-            position=(55, 410),
-            font_size=30,
-            color="black",
-            start_time=0,  # 从视频开始就显示
-            end_time=video_duration,
-        )  # 修改为视频总时长
-
-        # 添加右侧评论背景图片
-        editor.add_image(
-            "asset/images/right_evaluate.png",
-            position=(548, 332),
-            start_time=0,
-            end_time=video_duration,
-        )
-
-        # 添加右侧评论文字
-        editor.add_text(
-            right_comment,
-            position=(630, 660),
-            font_size=36,
-            color="black",
-            start_time=0,  # 从视频开始就显示
-            end_time=video_duration,
-            rotation_angle=5,  # 添加5度向上倾斜
-            stroke_width=3,
-        )  # 增加描边宽度以提升清晰度
-
-        # 添加右侧字数统计
-        right_cnt_str = "足足 " + str(len(left_comment)) + " 个字"
-        editor.add_text(
-            right_cnt_str,
-            position=(633, 505),
-            font_size=55,
-            color="white",
-            start_time=0,  # 从视频开始就显示
-            end_time=video_duration,
-            rotation_angle=5,  # 添加5度向上倾斜
-            stroke_width=8,
-        )  # 增加描边宽度以提升清晰度
-
-        # 添加底部logo图片
-        editor.add_image(
-            "asset/images/bottom_logo.png",
-            position=(780, 1625),
-            size=(200, 200),
-            start_time=0,
-            end_time=video_duration,
-        )
-
-        # 添加左下logo图片
-        editor.add_image(
-            "asset/images/sale_logo.png",
-            position=(0, 1300),
-            size=(300, 324),
-            start_time=0,
-            end_time=video_duration,
-        )
-
-        # 获取并更新合成次数
-        new_count = render_count_service.increment_count()
+        error = validate_texts(request.form)
+        if error:
+            return jsonify({"error": error}), 400
+        if render_backend not in VideoEditor.RENDER_BACKENDS:
+            return jsonify({"error": f"不支持的渲染方式: {render_backend}"}), 400
+        if encoder_profile and encoder_profile not in ENCODER_PROFILES:
+            return jsonify({"error": f"不支持的编码配置: {encoder_profile}"}), 400
+        if preview and preview not in VideoEditor.PREVIEW_KINDS:
+            return jsonify({"error": f"不支持的预览方式: {preview}"}), 400
+        video_path = video_index.path_for(template_id)
+        if video_path is None:
+            return jsonify({"error": f"未找到视频模板: {template_id}"}), 400
+
+        params = {
+            "bottom_comment": bottom_comment,
+            "shop_name": shop_name,
+            "left_comment": left_comment,
+            "right_comment": right_comment,
+            "template_id": template_id,
+            "render_backend": render_backend,
+            "encoder_profile": encoder_profile,
+            "audio_id": audio_id,
+            "seed": seed,
+            "segmented": segmented,
+        }
 
-        # 渲染并保存视频
         timestamp = int(time.time())
         random_num = random.randint(1000, 9999)
         output_filename = f"video_{template_id}_{timestamp}_{random_num}.mp4"
-        output_path = os.path.join("output", output_filename)
-        os.makedirs("output", exist_ok=True)
-
-        editor.render(output_path)
-
-        # 返回视频文件和合成次数
+        if not preview:
+            # 相同内容已渲染过时直接返回视频，不入队、不占用内存预算，也不计入合成次数
+            cached = find_cached(params, output_filename)
+            if cached is not None:
+                metrics.render_jobs_total.inc(status="finished", cached="true")
+                response = {
+                    "status": "finished",
+                    "render_count": render_count_service.get_count(),
+                    **cached,
+                }
+                return jsonify(response), 200
+
+        # 按估算的内存占用接纳任务，超出预算时要求客户端稍后重试
+        plan = load_plan(template_id)
+        template_duration = video_duration(video_path)
+        duration = plan.output_duration(params, template_duration)
+        segments = segment_workers() if segmented and render_backend == "moviepy" else 1
+        seconds = estimate_render_seconds(params, duration)
+        if preview:
+            # 预览在单个进程中渲染：单张画面只合成一帧，短视频按预览帧率合成
+            segments = 1
+            if preview == "still":
+                duration, seconds = 0, 1
+            else:
+                duration = min(duration, VideoEditor.PREVIEW_CLIP_SECONDS)
+                seconds = (
+                    estimate_render_seconds(params, duration) * VideoEditor.PREVIEW_FPS / 24
+                )
+        admission_key = uuid.uuid4().hex
+        if not admission_controller.try_acquire(
+            admission_key,
+            estimate_render_memory(
+                params,
+                duration,
+                segments,
+                len(plan.layers),
+                frame_cache_bytes(plan, template_duration, duration),
+            ),
+            seconds,
+        ):
+            metrics.render_rejected_total.inc()
+            response = jsonify({"error": "当前渲染任务较多，请稍后重试"})
+            response.headers["Retry-After"] = str(admission_controller.retry_after())
+            return response, 429
+
+        if preview:
+            # 预览不计入合成次数，确认后再提交完整渲染
+            new_count = None
+            extension = "jpg" if preview == "still" else "mp4"
+            output_filename = f"preview_{template_id}_{timestamp}_{random_num}.{extension}"
+            task, task_args = render_preview, (params, output_filename, preview)
+        else:
+            # 获取并更新合成次数
+            new_count = render_count_service.increment_count()
+            task, task_args = render_video, (params, output_filename)
+
+        # 渲染任务交给工作进程异步执行
+        try:
+            job_id = render_queue_service.submit(
+                task,
+                *task_args,
+                render_count=new_count,
+                admission_key=admission_key,
+            )
+        except Exception:
+            admission_controller.release(admission_key)
+            raise
+
+        # 立即返回任务ID，客户端通过任务接口查询进度和结果
         response = {
+            "job_id": job_id,
             "render_count": new_count,
-            "video_url": f"/download/{output_filename}",
+            "status_url": f"/jobs/{job_id}",
+            "result_url": f"/jobs/{job_id}/result",
         }
-        return jsonify(response)
+        if segmented and not preview:
+            # 实际使用的分段进程数，为1时（仅moviepy方式分段，或只有1个可用核）不分段
+            response["segments"] = segments
+        return jsonify(response), 202
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 
+@app.route("/process_batch", methods=["POST"])
+def process_batch():
+    """批量渲染同一模板的多组文字，按NDJSON逐行返回每个视频的结果
+
+    请求体为JSON：template_id、items（每项包含四个文字字段），可选
+    render_backend、encoder_profile、audio_id和seed。整组使用同一首背景音乐。
+    批量渲染只支持ffmpeg方式（同组的视频共用一次模板解码和静态叠加层输入）。
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "请求内容必须是JSON对象"}), 400
+    template_id = str(data.get("template_id") or "")
+    render_backend = data.get("render_backend", "ffmpeg")
+    encoder_profile = data.get("encoder_profile") or None
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items必须是非空列表"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"一次最多渲染{BATCH_MAX_ITEMS}个视频"}), 400
+    texts = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not all(
+            isinstance(item.get(name), str) for name, _, _ in TEXT_LIMITS
+        ):
+            return jsonify({"error": f"第{i + 1}项缺少文字字段"}), 400
+        error = validate_texts(item)
+        if error:
+            return jsonify({"error": f"第{i + 1}项: {error}"}), 400
+        texts.append({name: item[name] for name, _, _ in TEXT_LIMITS})
+    if render_backend != "ffmpeg":
+        return jsonify({"error": f"批量渲染只支持ffmpeg方式: {render_backend}"}), 400
+    if encoder_profile and encoder_profile not in ENCODER_PROFILES:
+        return jsonify({"error": f"不支持的编码配置: {encoder_profile}"}), 400
+    video_path = video_index.path_for(template_id)
+    if video_path is None:
+        return jsonify({"error": f"未找到视频模板: {template_id}"}), 400
+
+    params = {
+        "template_id": template_id,
+        "render_backend": render_backend,
+        "encoder_profile": encoder_profile,
+        "audio_id": data.get("audio_id") or None,
+        "seed": data.get("seed") or None,
+    }
+    try:
+        plan = load_plan(template_id)
+        template_duration = video_duration(video_path)
     except Exception as e:
-        # 出错时也要清理资源
-        if "editor" in locals():
-            editor.cleanup()
-        gc.collect()
         return jsonify({"error": str(e)}), 400
+    return Response(
+        _stream_batch(params, plan, template_duration, texts),
+        mimetype="application/x-ndjson",
+    )
+
+
+def _stream_batch(params, plan, template_duration, items):
+    """按内存预算逐组提交批量渲染任务，每组结束后逐行输出其中各视频的结果
+
+    已渲染过的相同内容不入队，最先逐行输出。
+    """
+    group_size = max(1, BATCH_GROUP_SIZE)
+    batch_num = random.randint(1000, 9999)
+    summary = {"status": "done", "total": len(items), "finished": 0, "failed": 0}
+
+    def output_filename(index):
+        return f"video_{params['template_id']}_{int(time.time())}_{batch_num}{index:04d}.mp4"
+
+    def result_line(index, item, result):
+        line = {"index": index, "shop_name": item["shop_name"]}
+        if "error" in result:
+            line.update(status="failed", error=result["error"])
+            summary["failed"] += 1
+        else:
+            line.update(
+                status="finished", video_url=result["video_url"], cached=result["cached"]
+            )
+            summary["finished"] += 1
+        return json.dumps(line, ensure_ascii=False) + "\n"
+
+    uncached = []  # (序号, 文字)
+    for index, item in enumerate(items):
+        # 整组共用背景音乐，与 render_batch 一样默认以模板ID为seed
+        result = find_cached(
+            dict(params, **item), output_filename(index), seed=params["template_id"]
+        )
+        if result is None:
+            uncached.append((index, item))
+        else:
+            metrics.render_jobs_total.inc(status="finished", cached="true")
+            yield result_line(index, item, result)
+
+    pending = [
+        uncached[start : start + group_size]
+        for start in range(0, len(uncached), group_size)
+    ]
+    running = {}  # 任务ID -> 该组的 (序号, 文字)
+
+    while pending or running:
+        # 内存预算允许时继续提交下一组
+        while pending:
+            group = pending[0]
+            texts = [item for _, item in group]
+            duration = max(plan.output_duration(item, template_duration) for item in texts)
+            admission_key = uuid.uuid4().hex
+            if not admission_controller.try_acquire(
+                admission_key,
+                estimate_batch_memory(params, texts, duration, len(plan.layers)),
+                estimate_render_seconds(params, duration) * len(group),
+            ):
+                break
+            render_count = render_count_service.increment_count(len(group))
+            try:
+                job_id = render_queue_service.submit(
+                    render_batch,
+                    params,
+                    texts,
+                    [output_filename(index) for index, _ in group],
+                    render_count=render_count,
+                    admission_key=admission_key,
+                )
+            except Exception:
+                admission_controller.release(admission_key)
+                raise
+            running[job_id] = group
+            pending.pop(0)
+
+        for job_id in list(running):
+            job = render_queue_service.get_job(job_id)
+            if job is not None and job["status"] not in ("finished", "failed"):
+                continue
+            group = running.pop(job_id)
+            if job is None or job["status"] == "failed":
+                error = job["error"] if job is not None else "渲染任务已过期"
+                results = [{"error": error}] * len(group)
+            else:
+                results = job["result"]["items"]
+            for (index, item), result in zip(group, results):
+                yield result_line(index, item, result)
+
+        if pending or running:
+            time.sleep(BATCH_POLL_INTERVAL)
+
+    yield json.dumps(summary, ensure_ascii=False) + "\n"
+
+
+@app.route("/jobs/<job_id>")
+def get_job_status(job_id):
+    job = render_queue_service.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "未找到对应的渲染任务"}), 404
+    return jsonify(
+        {
+            "job_id": job_id,
+            "status": job["status"],
+            "error": job["error"],
+            "progress": job["progress"],
+        }
+    )
+
+
+@app.route("/jobs/<job_id>/events")
+def stream_job_events(job_id):
+    """以Server-Sent Events推送任务的状态和进度，任务结束后发送done事件并关闭"""
+    if render_queue_service.get_job(job_id) is None:
+        return jsonify({"error": "未找到对应的渲染任务"}), 404
+    return Response(
+        _job_events(job_id),
+        mimetype="text/event-stream",
+        # 禁止缓存和nginx的响应缓冲，保证事件实时到达
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _job_events(job_id):
+    version = -1
+    while True:
+        job = render_queue_service.wait_for_update(job_id, version, EVENTS_KEEPALIVE)
+        if job is None:
+            yield "event: done\ndata: " + json.dumps(
+                {"status": "failed", "error": "渲染任务已过期"}, ensure_ascii=False
+            ) + "\n\n"
+            return
+        if job["version"] == version:
+            # 超时没有更新，发送注释行保持连接
+            yield ": keepalive\n\n"
+            continue
+        version = job["version"]
+        data = {"status": job["status"], "progress": job["progress"], "error": job["error"]}
+        if job["status"] in ("finished", "failed"):
+            yield "event: done\ndata: " + json.dumps(data, ensure_ascii=False) + "\n\n"
+            return
+        yield "event: progress\ndata: " + json.dumps(data, ensure_ascii=False) + "\n\n"
+
+
+@app.route("/jobs/<job_id>/result")
+def get_job_result(job_id):
+    job = render_queue_service.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "未找到对应的渲染任务"}), 404
+    if job["status"] == "failed":
+        return jsonify({"status": job["status"], "error": job["error"]}), 400
+    if job["status"] != "finished":
+        # 任务仍在排队或渲染中
+        return jsonify({"status": job["status"]}), 202
+
+    # 返回视频文件（或预览文件）和合成次数
+    result = job["result"]
+    response = {"status": job["status"], "render_count": job["render_count"]}
+    if "preview_url" in result:
+        response.update(preview=result["preview"], preview_url=result["preview_url"])
+    else:
+        response["video_url"] = result["video_url"]
+    return jsonify(response)
 
 
 @app.route("/get_count")
@@ -239,11 +472,7 @@ def get_download_count():
 
 @app.route("/templates")
 def get_templates():
-    input_dir = "asset/video"
-    video_files = [
-        f for f in os.listdir(input_dir) if f.lower().endswith((".mp4", ".avi", ".mov"))
-    ]
-    video_files.sort()  # 按照文件名正序排列
+    video_files = video_index.files()  # 按照文件名正序排列
     templates = [
         {
             "id": os.path.splitext(f)[0],  # 使用文件名（不含扩展名）作为ID
@@ -254,20 +483,97 @@ def get_templates():
     return jsonify(templates)
 
 
+class _DownloadFile(io.FileIO):
+    """下载用的文件对象，确认文件已完整发送后关闭时回调
+
+    服务器逐块读取时，读完最后一块后再次读取到空数据才算完整（说明之前
+    的数据都已写出）。gunicorn等服务器通过 socket.sendfile 直接发送时不经过
+    read，socket.sendfile 结束时会把文件位置移到已发送数据的末尾（seek），
+    据此判断是否完整。客户端提前断开、发送前出错时都不回调。
+
+    “完整”指服务器已把全部数据写入套接字（交给内核发送），并不代表客户端
+    已收到：较小的文件可以一次放进套接字发送缓冲区，此后客户端断开的
+    下载仍会计数。
+    """
+
+    def __init__(self, path, on_complete):
+        super().__init__(path, "rb")
+        self._size = os.fstat(self.fileno()).st_size
+        self._on_complete = on_complete
+        self._complete = False
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if not data and self.tell() >= self._size:
+            self._complete = True
+        return data
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        position = super().seek(pos, whence)
+        if position >= self._size:
+            self._complete = True
+        return position
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        if self._complete:
+            self._on_complete()
+
+
+def _is_full_download(response, file_size):
+    """判断响应是否发送完整的文件（200，或覆盖整个文件的206）"""
+    if request.method != "GET":
+        return False
+    if response.status_code == 200:
+        return True
+    if response.status_code == 206:
+        return response.headers.get("Content-Range") == (
+            f"bytes 0-{file_size - 1}/{file_size}"
+        )
+    return False
+
+
+@app.route("/preview/<filename>")
+def show_preview(filename):
+    """在页面中直接显示预览图片或短视频（不计入下载次数）"""
+    if not filename.startswith("preview_") or not os.path.isfile(
+        os.path.join("output", filename)
+    ):
+        return jsonify({"error": "未找到对应的预览文件"}), 404
+    return send_from_directory("output", filename, conditional=True, etag=True)
+
+
 @app.route("/download/<filename>")
 def download_video(filename):
     video_path = os.path.join("output", filename)
-    if not os.path.exists(video_path):
+    if not os.path.isfile(video_path):
         return jsonify({"error": "未找到对应的视频文件"}), 404
 
-    # 增加下载计数
-    new_count = download_count_service.increment_count()
-
-    # 返回文件并设置响应头以包含下载次数
-    response = send_file(video_path, as_attachment=True)
-    response.headers["X-Download-Count"] = str(new_count)
+    # 支持Range/206、ETag和Last-Modified条件请求；文件内容由服务器的
+    # wsgi.file_wrapper（如gunicorn的sendfile）或X-Sendfile直接发送
+    response = send_from_directory(
+        "output", filename, as_attachment=True, conditional=True, etag=True
+    )
+
+    # 只有完整发送整个文件后才增加下载计数，Range分段请求、HEAD和304不计数
+    if not _is_full_download(response, os.path.getsize(video_path)):
+        return response
+    if app.config["USE_X_SENDFILE"]:
+        # 文件由前端服务器发送，无法得知是否发送完成
+        download_count_service.increment_count()
+    else:
+        response.response.close()
+        response.response = wrap_file(
+            request.environ,
+            _DownloadFile(video_path, download_count_service.increment_count),
+        )
     return response
 
 
 if __name__ == "__main__":
+    # 开启调试重载时只在实际提供服务的子进程中启动渲染进程池
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        render_queue_service.start()
     app.run(debug=True, host="0.0.0.0", port=5000)
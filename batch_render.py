@@ -0,0 +1,125 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import urllib.error
+import urllib.request
+
+# 每个视频需要的文字字段（CSV表头或JSON字段名）
+TEXT_FIELDS = ('shop_name', 'left_comment', 'right_comment', 'bottom_comment')
+
+
+def load_items(path):
+    """读取批量文字：.csv（带表头，支持Excel导出的UTF-8 BOM）、.json（列表）或 .jsonl（每行一项）"""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if ext == '.csv':
+            rows = list(csv.DictReader(f))
+        elif ext == '.json':
+            rows = json.load(f)
+        elif ext == '.jsonl':
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            raise ValueError(f"不支持的文件格式: {ext}（支持 .csv、.json、.jsonl）")
+
+    items = []
+    for i, row in enumerate(rows):
+        missing = [name for name in TEXT_FIELDS if not isinstance(row.get(name), str)]
+        if missing:
+            raise ValueError(f"第{i + 1}项缺少字段: {', '.join(missing)}")
+        items.append({name: row[name] for name in TEXT_FIELDS})
+    return items
+
+
+def download(server, video_url, download_dir):
+    os.makedirs(download_dir, exist_ok=True)
+    path = os.path.join(download_dir, os.path.basename(video_url))
+    with urllib.request.urlopen(server.rstrip('/') + video_url) as response, open(path, 'wb') as f:
+        while True:
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                break
+            f.write(chunk)
+    return path
+
+
+def run_batch(args):
+    """提交批量渲染请求，逐行读取服务端返回的结果
+
+    Returns:
+        int: 失败的视频数量
+    """
+    payload = {
+        'template_id': args.template,
+        'items': load_items(args.input),
+    }
+    if args.profile:
+        payload['encoder_profile'] = args.profile
+    if args.audio_id:
+        payload['audio_id'] = args.audio_id
+    if args.seed:
+        payload['seed'] = args.seed
+
+    request = urllib.request.Request(
+        args.server.rstrip('/') + '/process_batch',
+        data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    try:
+        response = urllib.request.urlopen(request)
+    except urllib.error.HTTPError as e:
+        body = e.read().decode('utf-8', 'replace')
+        try:
+            body = json.loads(body).get('error', body)
+        except ValueError:
+            pass
+        raise RuntimeError(f"批量渲染请求失败（{e.code}）: {body}")
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else None
+    failed = 0
+    try:
+        with response:
+            # 服务端每渲染完一组就返回其中各视频的结果
+            for raw in response:
+                if not raw.strip():
+                    continue
+                result = json.loads(raw)
+                if result.get('status') == 'done':
+                    print(f"完成: 共{result['total']}个, 成功{result['finished']}个, 失败{result['failed']}个")
+                    continue
+                if result['status'] == 'failed':
+                    failed += 1
+                    print(f"[{result['index'] + 1}] {result['shop_name']}: 失败 - {result['error']}")
+                else:
+                    if args.download_dir:
+                        result['path'] = download(args.server, result['video_url'], args.download_dir)
+                    print(f"[{result['index'] + 1}] {result['shop_name']}: {result.get('path') or result['video_url']}")
+                if output:
+                    output.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    output.flush()
+    finally:
+        if output:
+            output.close()
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='批量渲染同一模板的多个视频')
+    parser.add_argument('input', help='文字列表文件（.csv/.json/.jsonl），字段: ' + ', '.join(TEXT_FIELDS))
+    parser.add_argument('-t', '--template', required=True, help='视频模板ID')
+    parser.add_argument('--profile', choices=['preview', 'standard', 'archive'],
+                        help='编码配置（默认使用模板版式中指定的配置或 standard）')
+    parser.add_argument('--audio-id', help='背景音乐文件名（不含扩展名），整批共用')
+    parser.add_argument('--seed', help='未指定背景音乐时用于选择音乐的seed')
+    parser.add_argument('--server', default='http://127.0.0.1:5000', help='服务地址（默认：http://127.0.0.1:5000）')
+    parser.add_argument('-o', '--output', help='把每个视频的结果写入JSON Lines文件')
+    parser.add_argument('-d', '--download-dir', help='渲染完成后下载视频到该目录')
+
+    args = parser.parse_args()
+    try:
+        failed = run_batch(args)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"错误: {e}")
+        sys.exit(2)
+    sys.exit(1 if failed else 0)
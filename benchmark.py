@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import statistics
+import subprocess
+
+# 基准测试的工作目录（合成素材、预处理模板和输出视频）
+BENCH_DIR = os.path.join('cache', 'benchmark')
+
+# 合成模板：名称 -> (宽, 高, 帧率, 时长秒)
+SYNTHETIC_TEMPLATES = {
+    'short': (720, 1280, 30, 3),
+    'full': (1080, 1920, 24, 10),
+}
+
+LONG_COMMENT = '这家店的菜品真的很好吃，分量足价格实惠，配送也很快，包装干净整洁，强烈推荐给大家！' * 2
+
+# 测试场景：名称 -> 渲染参数
+WORKLOADS = {
+    'short_comment': {
+        'template': 'full',
+        'bottom_comment': '好吃不贵，下次还来',
+        'render_backend': 'moviepy',
+    },
+    'long_comment': {
+        'template': 'full',
+        'bottom_comment': LONG_COMMENT,
+        'render_backend': 'moviepy',
+    },
+    'loop_short_template': {
+        'template': 'short',
+        'bottom_comment': LONG_COMMENT[:40],
+        'render_backend': 'moviepy',
+    },
+    'short_comment_ffmpeg': {
+        'template': 'full',
+        'bottom_comment': '好吃不贵，下次还来',
+        'render_backend': 'ffmpeg',
+    },
+    'long_comment_ffmpeg': {
+        'template': 'full',
+        'bottom_comment': LONG_COMMENT,
+        'render_backend': 'ffmpeg',
+    },
+    # 编码配置对比（与short_comment_ffmpeg相同的画面，分别使用预览和高画质配置）
+    'short_comment_preview': {
+        'template': 'full',
+        'bottom_comment': '好吃不贵，下次还来',
+        'render_backend': 'ffmpeg',
+        'encoder_profile': 'preview',
+    },
+    'short_comment_archive': {
+        'template': 'full',
+        'bottom_comment': '好吃不贵，下次还来',
+        'render_backend': 'ffmpeg',
+        'encoder_profile': 'archive',
+    },
+}
+
+# 对比时视为性能回退的指标：名称 -> 数值越大越好
+COMPARE_METRICS = {
+    'wall_s': False,
+    'fps': True,
+    'peak_rss_mb': False,
+    'output_bytes': False,
+}
+
+
+def ffmpeg_binary():
+    from moviepy.config import get_setting
+    return get_setting('FFMPEG_BINARY')
+
+
+def generate_assets(bench_dir):
+    """用ffmpeg测试源生成模板视频和背景音乐，已存在时跳过"""
+    asset_dir = os.path.join(bench_dir, 'assets')
+    os.makedirs(asset_dir, exist_ok=True)
+    ffmpeg = ffmpeg_binary()
+    for name, (width, height, fps, duration) in SYNTHETIC_TEMPLATES.items():
+        path = os.path.join(asset_dir, f'{name}.mp4')
+        if os.path.exists(path):
+            continue
+        subprocess.run([
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}:duration={duration}',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', path,
+        ], check=True)
+    audio_path = os.path.join(asset_dir, 'audio.wav')
+    if not os.path.exists(audio_path):
+        subprocess.run([
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', 'sine=frequency=440:duration=7',
+            '-ac', '2', '-ar', '44100', audio_path,
+        ], check=True)
+    return asset_dir
+
+
+def run_workload(name, bench_dir):
+    """在当前进程中执行一个测试场景，返回测量结果（由子进程调用）"""
+    from src.services.render_task import build_editor
+    from src.services.render_cache import RenderCacheService
+
+    workload = WORKLOADS[name]
+    asset_dir = os.path.join(bench_dir, 'assets')
+    params = {
+        'shop_name': '基准测试小店',
+        'left_comment': '这次在美团上订餐真的很方便，味道也很好',
+        'right_comment': '强烈推荐',
+        'bottom_comment': workload['bottom_comment'],
+        'encoder_profile': workload.get('encoder_profile'),
+    }
+    for field in RenderCacheService.TEXT_FIELDS:
+        params[field] = RenderCacheService.normalize_text(params[field])
+    output_path = os.path.join(bench_dir, f'{name}.mp4')
+
+    start = time.perf_counter()
+    editor = build_editor(
+        params,
+        os.path.join(asset_dir, f"{workload['template']}.mp4"),
+        os.path.join(asset_dir, 'audio.wav'),
+    )
+    editor.render(output_path, backend=workload['render_backend'])
+    wall = time.perf_counter() - start
+
+    timings = editor.timer.snapshot()
+    frames = timings['counters'].get('frames', 0)
+    # ru_maxrss在Linux上以KB为单位；编码时的ffmpeg子进程单独统计
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        'wall_s': round(wall, 3),
+        'frames': frames,
+        'fps': round(frames / wall, 2) if wall else 0,
+        'peak_rss_mb': round(self_rss / 1024, 1),
+        'peak_child_rss_mb': round(children_rss / 1024, 1),
+        'output_bytes': os.path.getsize(output_path),
+        'stages': timings['stages'],
+    }
+
+
+def run_in_subprocess(name, bench_dir):
+    """每次测试都在新进程中执行，避免缓存和内存峰值互相影响"""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), 'worker', name, '--bench-dir', bench_dir],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"测试场景 {name} 执行失败: {result.stderr.strip()[-500:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    """多次运行取中位数（各阶段耗时同样取中位数）"""
+    summary = {}
+    for key in runs[0]:
+        if key == 'stages':
+            stages = sorted({stage for run in runs for stage in run['stages']})
+            summary['stages'] = {
+                stage: round(statistics.median(run['stages'].get(stage, 0) for run in runs), 4)
+                for stage in stages
+            }
+        else:
+            summary[key] = statistics.median(run[key] for run in runs)
+    summary['runs'] = len(runs)
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names, repeat, bench_dir, output):
+    generate_assets(bench_dir)
+    # 基准测试使用独立的模板和背景音乐预处理目录，第一次运行前先完成预处理
+    from src.utils.template_cache import prepare_template
+    from src.utils.audio_cache import prepare_audio_bed
+    for name in SYNTHETIC_TEMPLATES:
+        prepare_template(os.path.join(bench_dir, 'assets', f'{name}.mp4'))
+    prepare_audio_bed(os.path.join(bench_dir, 'assets', 'audio.wav'))
+
+    results = {}
+    for name in names:
+        runs = []
+        for i in range(repeat):
+            run = run_in_subprocess(name, bench_dir)
+            print(f"{name} #{i + 1}: {run['wall_s']}秒, {run['fps']}帧/秒, "
+                  f"峰值内存 {run['peak_rss_mb']}MB, 文件大小 {run['output_bytes']}字节")
+            runs.append(run)
+        results[name] = summarize(runs)
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {output}")
+    return report
+
+
+def compare_results(baseline_path, current_path, threshold):
+    """对比两次结果，指标变差超过threshold（比例）时视为回退
+
+    Returns:
+        int: 回退的指标数量
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    with open(current_path, encoding='utf-8') as f:
+        current = json.load(f)['results']
+
+    regressions = 0
+    for name in sorted(set(baseline) & set(current)):
+        for metric, higher_is_better in COMPARE_METRICS.items():
+            old, new = baseline[name].get(metric), current[name].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > threshold:
+                flag = '  <-- 回退'
+                regressions += 1
+            print(f"{name:24} {metric:14} {old:>14} -> {new:<14} {change:+.1%}{flag}")
+    for name in sorted(set(baseline) ^ set(current)):
+        print(f"{name:24} 只存在于其中一份结果中，已跳过")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='视频渲染基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='运行基准测试')
+    run_parser.add_argument('workloads', nargs='*', default=list(WORKLOADS),
+                            help=f"要运行的测试场景（默认全部：{', '.join(WORKLOADS)}）")
+    run_parser.add_argument('--repeat', type=int, default=3, help='每个场景运行次数，取中位数（默认：3）')
+    run_parser.add_argument('--bench-dir', default=BENCH_DIR, help=f'工作目录（默认：{BENCH_DIR}）')
+    run_parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results.json'),
+                            help='结果JSON文件路径')
+
+    compare_parser = subparsers.add_parser('compare', help='对比两次基准测试结果')
+    compare_parser.add_argument('baseline', help='基准结果JSON文件')
+    compare_parser.add_argument('current', help='当前结果JSON文件')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='指标变差超过该比例时视为回退（默认：0.1）')
+
+    worker_parser = subparsers.add_parser('worker', help=argparse.SUPPRESS)
+    worker_parser.add_argument('workload', choices=list(WORKLOADS))
+    worker_parser.add_argument('--bench-dir', default=BENCH_DIR)
+
+    args = parser.parse_args()
+    if args.command == 'worker':
+        os.environ.setdefault('TEMPLATE_CACHE_DIR', os.path.join(args.bench_dir, 'templates'))
+        os.environ.setdefault('AUDIO_CACHE_DIR', os.path.join(args.bench_dir, 'audio'))
+        print(json.dumps(run_workload(args.workload, args.bench_dir)))
+    elif args.command == 'run':
+        unknown = [name for name in args.workloads if name not in WORKLOADS]
+        if unknown:
+            parser.error(f"未知的测试场景: {', '.join(unknown)}")
+        os.environ.setdefault('TEMPLATE_CACHE_DIR', os.path.join(args.bench_dir, 'templates'))
+        os.environ.setdefault('AUDIO_CACHE_DIR', os.path.join(args.bench_dir, 'audio'))
+        run_benchmarks(args.workloads, args.repeat, args.bench_dir, args.output)
+    else:
+        regressions = compare_results(args.baseline, args.current, args.threshold)
+        print(f"共发现 {regressions} 项回退" if regressions else '未发现回退')
+        sys.exit(1 if regressions else 0)
@@ -4,7 +4,7 @@ import re
 import argparse
 
 def clean_old_videos(days=3):
-    """清理指定天数之前的视频文件
+    """清理指定天数之前的视频文件（包括预览图片和预览视频）
     
     Args:
         days: 清理指定天数之前的文件，如果为0则清理所有文件
@@ -24,12 +24,12 @@ def clean_old_videos(days=3):
     cutoff_time = current_time - (days * 24 * 60 * 60)
 
     # 正则表达式用于从文件名中提取时间戳
-    timestamp_pattern = re.compile(r'video_\d+_(\d+)_\d+\.mp4')
+    timestamp_pattern = re.compile(r'(?:video|preview)_\d+_(\d+)_\d+\.(?:mp4|jpg)')
 
     deleted_count = 0
     # 遍历输出目录中的所有文件
     for filename in os.listdir(output_dir):
-        if not filename.endswith('.mp4'):
+        if not filename.endswith(('.mp4', '.jpg')):
             continue
 
         should_delete = False
@@ -55,11 +55,35 @@ def clean_old_videos(days=3):
 
     return deleted_count
 
+def clean_render_cache(days=None, max_mb=None):
+    """按保留天数和总大小淘汰渲染结果缓存
+
+    Args:
+        days: 缓存保留天数，默认读取环境变量 RENDER_CACHE_DAYS
+        max_mb: 缓存总大小上限（MB），默认读取环境变量 RENDER_CACHE_MAX_MB
+    Returns:
+        int: 已删除的缓存文件数量
+    """
+    from src.services.render_cache import RenderCacheService
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    cache_dir = os.environ.get('RENDER_CACHE_DIR', os.path.join(script_dir, 'output', 'cache'))
+    if not os.path.exists(cache_dir):
+        return 0
+    max_bytes = max_mb * 1024 * 1024 if max_mb is not None else None
+    return RenderCacheService(cache_dir=cache_dir).evict(days, max_bytes)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='清理指定天数之前的视频文件')
     parser.add_argument('--days', type=int, default=3,
                         help='清理指定天数之前的文件，设置为0则清理所有文件（默认：3天）')
+    parser.add_argument('--cache-days', type=float, default=None,
+                        help='渲染缓存保留天数（默认：环境变量RENDER_CACHE_DAYS或7天）')
+    parser.add_argument('--cache-max-mb', type=int, default=None,
+                        help='渲染缓存总大小上限MB（默认：环境变量RENDER_CACHE_MAX_MB或2048）')
     args = parser.parse_args()
 
     deleted_count = clean_old_videos(args.days)
-    print(f"清理完成，共删除 {deleted_count} 个文件")
\ No newline at end of file
+    print(f"清理完成，共删除 {deleted_count} 个文件")
+    cache_deleted = clean_render_cache(args.cache_days, args.cache_max_mb)
+    print(f"渲染缓存清理完成，共删除 {cache_deleted} 个文件")
\ No newline at end of file
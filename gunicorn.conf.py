@@ -0,0 +1,62 @@
+"""生产环境的gunicorn配置：gunicorn -c gunicorn.conf.py app:app
+
+任务状态、接纳控制的内存预留和渲染进度都保存在Web进程的内存中，
+因此只启动一个Web进程，由多个线程处理请求；视频合成在该进程的
+渲染进程池中执行（进程数由 RENDER_WORKERS 配置），渲染进程在开始
+接受连接之前全部启动并完成预热。
+"""
+import os
+import time
+import threading
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+# Web进程数固定为1（见上方说明），并发请求由线程处理
+workers = 1
+worker_class = "gthread"
+# 处理请求的线程数，每个进度事件流（/jobs/<job_id>/events）占用一个线程
+threads = int(os.environ.get("WEB_THREADS", 32))
+# 在主进程中导入应用（MoviePy、numpy、OpenCV等），Web进程重启时无需重新导入
+preload_app = True
+# 停止或重启时等待进行中的渲染任务完成的时间（秒）
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 300))
+accesslog = "-"
+# 检查渲染进程池是否可用的间隔（秒）
+RENDER_HEALTH_INTERVAL = int(os.environ.get("RENDER_HEALTH_INTERVAL", 10))
+# 重建渲染进程池后等待预热完成的最长时间（秒）
+RENDER_WARM_UP_TIMEOUT = int(os.environ.get("RENDER_WARM_UP_TIMEOUT", 300))
+
+
+def post_worker_init(worker):
+    """Web进程开始接受连接之前启动渲染进程池并等待全部渲染进程预热完成"""
+    from app import render_queue_service
+
+    render_queue_service.start()
+    # 预热可能超过gunicorn的超时时间，等待期间定期发送心跳
+    while not render_queue_service.wait_ready(timeout=5):
+        worker.notify()
+    threading.Thread(
+        target=_watch_render_pool,
+        args=(worker, render_queue_service),
+        name="render-health",
+        daemon=True,
+    ).start()
+
+
+def _watch_render_pool(worker, service):
+    """定期检查渲染进程池：渲染进程异常退出导致进程池损坏时重建，
+    重建失败则让Web进程退出，由gunicorn重新启动并预热"""
+    while worker.alive:
+        time.sleep(RENDER_HEALTH_INTERVAL)
+        if service.recover(timeout=RENDER_WARM_UP_TIMEOUT):
+            continue
+        worker.log.error("渲染进程池重建失败，重新启动Web进程")
+        worker.alive = False
+        return
+
+
+def worker_exit(server, worker):
+    """Web进程退出时关闭渲染进程池，等待进行中的任务完成"""
+    from app import render_queue_service
+
+    # 任务状态随Web进程一起丢失，排队中的任务不再执行
+    render_queue_service.shutdown(wait=True, cancel_pending=True)
@@ -1,11 +1,12 @@
 import schedule
 import time
-from clean_videos import clean_old_videos
+from clean_videos import clean_old_videos, clean_render_cache
 
 
 def cleanup_job():
     """定时清理任务"""
     clean_old_videos(days=3)  # 清理3天前的视频
+    clean_render_cache()  # 按保留天数和总大小淘汰渲染缓存
 
 
 # 每天凌晨2点执行清理
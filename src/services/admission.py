@@ -0,0 +1,151 @@
+import os
+import math
+import time
+import threading
+
+
+MB = 1024 * 1024
+
+# 单个渲染任务的内存估算参数（MB），根据 benchmark.py 测得的峰值内存校准
+BASE_MEMORY_MB = {"moviepy": 250, "ffmpeg": 150}  # 进程本身、解码器和模板读取缓冲
+ENCODER_MEMORY_MB = 100  # ffmpeg编码子进程
+OVERLAY_MEMORY_MB = {"moviepy": 8, "ffmpeg": 2}  # 每个叠加层的图片数组
+TEXT_CHAR_MEMORY_MB = 0.1  # 每个字符的文字图片和打字机遮罩
+SECOND_MEMORY_MB = 1  # 每秒输出视频的读帧和编码缓冲
+
+# 默认版式中的叠加层数量（图片和文字）
+LAYOUT_OVERLAYS = 12
+
+# 每秒输出视频的预计渲染耗时（秒），用于计算Retry-After
+RENDER_SECONDS_PER_SECOND = {"moviepy": 1.5, "ffmpeg": 0.5}
+
+
+def estimate_render_memory(
+    params, duration, segments=1, overlays=LAYOUT_OVERLAYS, frame_cache_bytes=0
+):
+    """估算一次渲染的峰值常驻内存（字节）
+
+    Args:
+        params: 渲染参数（文字字段和render_backend）
+        duration: 输出视频时长（秒）
+        segments: 分段并行渲染时同时运行的分段进程数
+        overlays: 版式中的叠加层数量
+        frame_cache_bytes: moviepy方式循环播放模板时缓存画面的字节数
+            （见 frame_cache.loop_cache_bytes，不循环时为0）
+    """
+    backend = params.get("render_backend", "moviepy")
+    text_length = sum(
+        len(params.get(name) or "")
+        for name in ("shop_name", "left_comment", "right_comment", "bottom_comment")
+    )
+    per_process = (
+        BASE_MEMORY_MB[backend]
+        + ENCODER_MEMORY_MB
+        + overlays * OVERLAY_MEMORY_MB[backend]
+        + text_length * TEXT_CHAR_MEMORY_MB
+        + duration * SECOND_MEMORY_MB
+    )
+    if backend == "moviepy":
+        per_process += frame_cache_bytes / MB
+    # 分段渲染时父进程和每个分段进程各自持有完整的合成图
+    return int(per_process * (segments + 1 if segments > 1 else 1) * MB)
+
+
+def estimate_batch_memory(params, items, duration, overlays=LAYOUT_OVERLAYS):
+    """估算一组批量渲染的峰值常驻内存（字节）
+
+    批量渲染只使用ffmpeg方式，由一个进程同时编码整组视频，模板解码等基础开销
+    只计一次。
+
+    Args:
+        params: 整组共用的渲染参数
+        items: 每个视频的文字字段
+        duration: 最长的输出视频时长（秒）
+    """
+    per_item = [
+        estimate_render_memory(dict(params, **item), duration, overlays=overlays)
+        for item in items
+    ]
+    base = BASE_MEMORY_MB["ffmpeg"] * MB
+    return base + sum(size - base for size in per_item)
+
+
+def estimate_render_seconds(params, duration):
+    """估算一次渲染的耗时（秒）"""
+    return duration * RENDER_SECONDS_PER_SECOND[params.get("render_backend", "moviepy")]
+
+
+def _cgroup_memory_limit():
+    """容器内存上限（cgroup v2或v1，字节），没有限制时返回None"""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit == "max":
+            return None
+        return int(limit)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/memory/memory.limit_in_bytes") as f:
+            # 未设置限制时v1返回一个接近2^63的值，由调用方与物理内存取较小值
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+class AdmissionController:
+    """按内存预算接纳渲染任务
+
+    每个任务入队时预留估算的内存，任务结束后释放；预留总量超过预算时拒绝新任务，
+    由调用方返回429和Retry-After。没有任何任务在执行时总是接纳，
+    避免单个超出预算的任务永远无法执行。
+    """
+
+    def __init__(self, budget_bytes=None):
+        if budget_bytes is None:
+            budget_bytes = self.default_budget()
+        self.budget_bytes = budget_bytes
+        self._reservations = {}  # 任务ID -> (字节数, 开始时间, 预计耗时)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_budget():
+        """环境变量 RENDER_MEMORY_BUDGET_MB，默认使用物理内存和容器内存上限中较小值的70%"""
+        budget_mb = os.environ.get("RENDER_MEMORY_BUDGET_MB")
+        if budget_mb:
+            return int(float(budget_mb) * MB)
+        try:
+            total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (ValueError, OSError):
+            total = None
+        limit = _cgroup_memory_limit()
+        if limit and limit > 0:
+            total = min(total, limit) if total else limit
+        if not total:
+            return 4096 * MB
+        return int(total * 0.7)
+
+    def try_acquire(self, key, size, expected_seconds):
+        """尝试为任务预留内存，成功返回True"""
+        with self._lock:
+            reserved = sum(s for s, _, _ in self._reservations.values())
+            if self._reservations and reserved + size > self.budget_bytes:
+                return False
+            self._reservations[key] = (size, time.monotonic(), expected_seconds)
+            return True
+
+    def release(self, key):
+        with self._lock:
+            self._reservations.pop(key, None)
+
+    def retry_after(self):
+        """预计最早有任务结束的秒数（至少1秒）"""
+        now = time.monotonic()
+        with self._lock:
+            remaining = [
+                started + expected - now
+                for _, started, expected in self._reservations.values()
+            ]
+        if not remaining:
+            return 1
+        return max(1, math.ceil(min(remaining)))
@@ -0,0 +1,112 @@
+import os
+import fcntl
+import atexit
+import threading
+
+
+class BatchedCountService:
+    """批量落盘的计数服务
+
+    计数保存在内存中，增加和读取都不访问文件；后台线程每隔 flush_interval 秒
+    把新增的计数累加到计数文件（持有文件排他锁），进程退出时再刷新一次。
+    多个进程共享同一个计数文件时各自累加增量，不会互相覆盖。
+    """
+
+    def __init__(self, count_file, flush_interval=None):
+        self.count_file = count_file
+        self.flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else float(os.environ.get("COUNTER_FLUSH_INTERVAL", 1.0))
+        )
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._ensure_count_file()
+        self._base = self._read_file()  # 最近一次从文件读取的计数
+        self._pending = 0  # 尚未写入文件的增量
+        self._pid = None
+        self._stop = threading.Event()
+        atexit.register(self.flush)
+
+    def _ensure_count_file(self):
+        """确保计数文件存在"""
+        os.makedirs(os.path.dirname(self.count_file), exist_ok=True)
+        if not os.path.exists(self.count_file):
+            with open(self.count_file, "w") as f:
+                f.write("0")
+
+    def _read_file(self):
+        with open(self.count_file, "r") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+            try:
+                return int(f.read().strip() or 0)
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _ensure_flusher(self):
+        """在当前进程中启动刷新线程（fork出的子进程需要重新启动）"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                # 父进程的增量由父进程负责写入
+                self._pending = 0
+            self._pid = pid
+            self._stop = threading.Event()
+            thread = threading.Thread(
+                target=self._flush_loop, name="counter-flush", daemon=True
+            )
+            thread.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def flush(self):
+        """把内存中的增量累加到计数文件，并同步其他进程写入的计数"""
+        if self._pid is not None and self._pid != os.getpid():
+            return
+        with self._flush_lock:
+            with self._lock:
+                delta = self._pending
+            if not delta:
+                count = self._read_file()
+            else:
+                with open(self.count_file, "r+") as f:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                    try:
+                        count = int(f.read().strip() or 0) + delta
+                        f.seek(0)
+                        f.truncate()
+                        f.write(str(count))
+                        f.flush()
+                        os.fsync(f.fileno())
+                    finally:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            with self._lock:
+                self._pending -= delta
+                self._base = count
+
+    def get_count(self):
+        """获取当前计数"""
+        self._ensure_flusher()
+        with self._lock:
+            return self._base + self._pending
+
+    def increment_count(self, amount=1):
+        """增加计数并返回新值"""
+        self._ensure_flusher()
+        with self._lock:
+            self._pending += amount
+            return self._base + self._pending
+
+    def close(self):
+        """停止刷新线程并写入剩余的增量"""
+        self._stop.set()
+        self.flush()
@@ -0,0 +1,179 @@
+import bisect
+import threading
+
+# 耗时直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """累积分桶的直方图，输出 _bucket、_sum 和 _count"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [各分桶计数, 总和, 总次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = state
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted(
+                (key, (list(counts), total, count))
+                for key, (counts, total, count) in self._values.items()
+            )
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            yield f"{self.name}_bucket", labels, count
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class MetricsRegistry:
+    """进程内指标注册表，按Prometheus文本格式输出"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """生成 /metrics 接口返回的文本"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP请求处理耗时", ("endpoint", "method", "status")
+)
+render_jobs_total = registry.counter(
+    "render_jobs_total", "渲染任务数量", ("status", "cached")
+)
+render_job_seconds = registry.histogram(
+    "render_job_duration_seconds", "渲染任务从入队到结束的耗时", ("status",)
+)
+render_stage_seconds = registry.histogram(
+    "render_stage_duration_seconds", "渲染各阶段耗时", ("stage",)
+)
+render_frames_total = registry.counter("render_frames_total", "已渲染的视频帧数")
+render_overlays_total = registry.counter("render_overlays_total", "已渲染的叠加层数量")
+render_bytes_written_total = registry.counter(
+    "render_bytes_written_total", "已写入的视频文件字节数"
+)
+render_rejected_total = registry.counter(
+    "render_rejected_total", "因内存预算不足被拒绝的渲染请求数量"
+)
+text_cache_total = registry.counter(
+    "render_text_cache_total", "文字图片缓存命中情况", ("result",)
+)
+frame_cache_hits_total = registry.counter(
+    "render_frame_cache_hits_total", "循环播放时从缓存读取的模板画面数量"
+)
+
+
+def record_render_job(job):
+    """记录结束的渲染任务（在Web进程中由任务完成回调调用）"""
+    result = job.get("result") or {}
+    cached = "true" if result.get("cached") else "false"
+    render_jobs_total.inc(status=job["status"], cached=cached)
+    if job.get("finished_at") is not None:
+        render_job_seconds.observe(
+            job["finished_at"] - job["created_at"], status=job["status"]
+        )
+
+    timings = result.get("timings")
+    if not timings:
+        return
+    for stage, seconds in timings["stages"].items():
+        render_stage_seconds.observe(seconds, stage=stage)
+    counters = timings["counters"]
+    render_frames_total.inc(counters.get("frames", 0))
+    render_overlays_total.inc(counters.get("overlays", 0))
+    render_bytes_written_total.inc(counters.get("bytes_written", 0))
+    text_cache_total.inc(counters.get("text_cache_hits", 0), result="hit")
+    text_cache_total.inc(counters.get("text_cache_misses", 0), result="miss")
+    frame_cache_hits_total.inc(counters.get("frame_cache_hits", 0))
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import unicodedata
+
+from src.utils.template_cache import file_hash
+
+# 渲染逻辑或素材布局发生变化时修改此版本号，使旧的缓存全部失效
+RENDER_CACHE_VERSION = "1"
+
+
+class RenderCacheService:
+    """按请求内容寻址的渲染结果缓存
+
+    缓存文件以内容哈希命名存放在 output/cache 目录，命中时通过硬链接
+    生成新的 video_<模板>_<时间戳>_<随机数>.mp4，因此 clean_videos.py
+    清理输出文件不会影响缓存，缓存本身按时间和总大小单独淘汰。
+
+    硬链接与缓存文件共享修改时间，最近使用时间因此记录在单独的
+    <键>.used 文件上，命中时不修改缓存文件本身（及各输出文件）的时间。
+    """
+
+    # 参与缓存键计算的表单字段
+    TEXT_FIELDS = ("shop_name", "left_comment", "right_comment", "bottom_comment")
+
+    def __init__(self, cache_dir=None, asset_dir="asset/images"):
+        self.cache_dir = cache_dir or os.environ.get(
+            "RENDER_CACHE_DIR", os.path.join("output", "cache")
+        )
+        self.asset_dir = asset_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def normalize_text(text):
+        """统一Unicode形式、换行符和首尾空白"""
+        text = unicodedata.normalize("NFC", text)
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return "\n".join(line.rstrip() for line in text.strip().split("\n"))
+
+    def _asset_version(self):
+        """叠加素材的版本（所有图片内容哈希）"""
+        digests = []
+        for f in sorted(os.listdir(self.asset_dir)):
+            path = os.path.join(self.asset_dir, f)
+            if os.path.isfile(path) and not f.startswith("."):
+                digests.append((f, file_hash(path)))
+        return digests
+
+    def make_key(self, params, video_path, audio_path, layout=None):
+        """根据规范化后的表单内容、渲染和编码方式、模板视频、背景音乐、版式和素材版本计算缓存键
+
+        Args:
+            layout: 版式文件的内容哈希（RenderPlan.digest）
+        """
+        payload = {
+            "version": RENDER_CACHE_VERSION,
+            "fields": {
+                name: self.normalize_text(params.get(name, ""))
+                for name in self.TEXT_FIELDS
+            },
+            "render_backend": params.get("render_backend", "moviepy"),
+            "encoder_profile": params.get("encoder_profile"),
+            "video": file_hash(video_path),
+            "audio": file_hash(audio_path),
+            "assets": self._asset_version(),
+            "layout": layout,
+        }
+        data = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    @staticmethod
+    def _used_path(cache_path):
+        return os.path.splitext(cache_path)[0] + ".used"
+
+    def _touch_used(self, cache_path):
+        """更新缓存文件的最近使用时间（见类说明）"""
+        used_path = self._used_path(cache_path)
+        try:
+            with open(used_path, "a"):
+                pass
+            os.utime(used_path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _link(src, dst):
+        """优先使用硬链接，不支持时退回复制"""
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    def lookup(self, key, output_path):
+        """命中时把缓存文件链接到output_path并返回True"""
+        cache_path = self._cache_path(key)
+        try:
+            self._link(cache_path, output_path)
+        except FileNotFoundError:
+            return False
+        # 淘汰时按最近使用时间计算
+        self._touch_used(cache_path)
+        return True
+
+    def store(self, key, output_path):
+        """把新渲染的视频加入缓存"""
+        cache_path = self._cache_path(key)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            self._link(output_path, tmp_path)
+            os.replace(tmp_path, cache_path)
+            self._touch_used(cache_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self, max_age_days=None, max_bytes=None):
+        """删除超过保留天数的缓存，并在总大小超限时删除最久未使用的文件
+
+        Returns:
+            int: 已删除的文件数量
+        """
+        if max_age_days is None:
+            max_age_days = float(os.environ.get("RENDER_CACHE_DAYS", 7))
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("RENDER_CACHE_MAX_MB", 2048)) * 1024 * 1024
+
+        entries = []
+        names = set(os.listdir(self.cache_dir))
+        for f in names:
+            path = os.path.join(self.cache_dir, f)
+            if f.endswith(".used") and os.path.splitext(f)[0] + ".mp4" not in names:
+                # 缓存文件已被删除，只剩使用时间记录
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not f.endswith(".mp4"):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            used = stat.st_mtime
+            try:
+                used = max(used, os.stat(self._used_path(path)).st_mtime)
+            except FileNotFoundError:
+                pass
+            entries.append((used, stat.st_size, path))
+        entries.sort()
+
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        total = sum(size for _, size, _ in entries)
+        deleted_count = 0
+        for used, size, path in entries:
+            if used >= cutoff and total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                deleted_count += 1
+                total -= size
+            except FileNotFoundError:
+                pass
+            try:
+                os.remove(self._used_path(path))
+            except FileNotFoundError:
+                pass
+        return deleted_count
@@ -0,0 +1,323 @@
+import os
+import time
+import uuid
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.utils import progress
+from src.utils.encoder_profiles import host_cpus
+from src.utils.logger import VideoLogger
+
+logger = VideoLogger()
+
+
+def _init_worker(channel, initializer):
+    """工作进程初始化：设置进度队列后执行预热函数"""
+    # 不沿用gunicorn Web进程的信号处理（收到SIGTERM只标记退出），
+    # 恢复默认处理，进程池损坏时才能终止剩余的工作进程
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGQUIT):
+        signal.signal(signum, signal.SIG_DFL)
+    signal.set_wakeup_fd(-1)
+    progress.install(channel)
+    if initializer is not None:
+        initializer()
+    # 通知Web进程本进程已完成预热（见 RenderQueueService.wait_ready）
+    channel.put((None, os.getpid()))
+
+
+class RenderQueueService:
+    """渲染任务队列：请求只负责入队，由进程池中的工作进程完成渲染
+
+    工作进程通过进度队列上报各任务的渲染阶段和已编码帧数，由后台线程
+    写入任务状态的 progress 字段（见 src/utils/progress.py）。
+
+    工作进程异常退出（如内存不足被系统杀死）后进程池不可再用，其中的
+    任务全部失败；下一次提交任务时重新创建进程池并预热（见 rebuild）。
+    """
+
+    # 已结束的任务保留时长（秒），超时后从内存中清除
+    JOB_TTL = 3600
+    # 进度队列长度，Web进程来不及读取时工作进程丢弃新的进度
+    PROGRESS_QUEUE_SIZE = 1000
+
+    def __init__(
+        self, max_workers=None, on_finished=None, initializer=None, max_tasks=None
+    ):
+        if max_workers is None:
+            max_workers = int(os.environ.get("RENDER_WORKERS", host_cpus()))
+        self.max_workers = max(1, max_workers)
+        # 每个工作进程最多执行的任务数，达到后由新进程替换以回收MoviePy/ffmpeg
+        # 累积占用的内存；0或不设置表示不回收
+        if max_tasks is None:
+            max_tasks = int(os.environ.get("RENDER_MAX_TASKS", 0))
+        self.max_tasks = max_tasks if max_tasks > 0 else None
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # 任务状态或进度变化时通知等待中的请求（见 wait_for_update）
+        self._updated = threading.Condition(self._lock)
+        self._progress_channel = None
+        self._progress_reader = None
+        # 已完成预热的工作进程数（包括回收后替换的进程）
+        self._ready = 0
+        self._warm_up_futures = []
+        # 任务结束时的回调，参数为任务状态快照（用于统计指标）
+        self._on_finished = on_finished
+        # 工作进程启动时执行的预热函数
+        self._initializer = initializer
+
+    def _get_executor(self):
+        """延迟创建进程池，避免在Flask重载进程或gunicorn主进程中启动工作进程"""
+        if self._executor is None:
+            # 进程池可能在健康检查线程中重建，此时Web进程已有多个线程，
+            # 直接fork可能在子进程中死锁；统一由forkserver启动工作进程
+            # （回收工作进程也不支持fork方式），forkserver预先导入渲染模块，
+            # 启动和替换进程时无需重新导入
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["src.services.render_task"])
+            options = {}
+            if self.max_tasks is not None:
+                options = {"max_tasks_per_child": self.max_tasks}
+            # 进度队列需要与进程池使用相同的启动方式创建
+            self._progress_channel = context.Queue(self.PROGRESS_QUEUE_SIZE)
+            self._progress_reader = threading.Thread(
+                target=self._read_progress, args=(self._progress_channel,), daemon=True
+            )
+            self._progress_reader.start()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._progress_channel, self._initializer),
+                **options,
+            )
+        return self._executor
+
+    def _read_progress(self, channel):
+        """后台线程：把工作进程上报的进度写入对应任务"""
+        while True:
+            try:
+                item = channel.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+            job_id, state = item
+            with self._lock:
+                if job_id is None:
+                    # 只统计当前进程池的工作进程
+                    if channel is self._progress_channel:
+                        self._ready += 1
+                        self._updated.notify_all()
+                    continue
+                job = self._jobs.get(job_id)
+                if job is None or job["finished_at"] is not None:
+                    continue
+                job["progress"] = state
+                job["version"] += 1
+                self._updated.notify_all()
+
+    def start(self):
+        """提前启动全部工作进程并执行预热，避免第一个请求承担启动开销"""
+        with self._lock:
+            executor = self._get_executor()
+            self._warm_up_futures = [
+                executor.submit(os.getpid) for _ in range(self.max_workers)
+            ]
+
+    def wait_ready(self, timeout=None):
+        """等待 start 启动的全部工作进程完成预热
+
+        Returns:
+            全部完成时返回True，超时返回False
+        Raises:
+            RuntimeError: 工作进程启动或预热失败
+        """
+
+        def failed():
+            return any(
+                f.done() and f.exception() is not None for f in self._warm_up_futures
+            )
+
+        with self._lock:
+            ready = self._updated.wait_for(
+                lambda: self._ready >= self.max_workers or failed(), timeout
+            )
+            if failed():
+                raise RuntimeError("渲染进程启动失败") from next(
+                    f.exception()
+                    for f in self._warm_up_futures
+                    if f.done() and f.exception() is not None
+                )
+            return bool(ready)
+
+    def submit(self, fn, *args, **extra):
+        """提交渲染任务并立即返回任务ID"""
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "progress": None,
+            "version": 0,  # 状态或进度每次变化时加1
+        }
+        job.update(extra)
+        for attempt in range(2):
+            with self._lock:
+                self._purge_expired()
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(progress.run_job, job_id, fn, *args)
+                except BrokenProcessPool:
+                    if attempt:
+                        raise
+                else:
+                    job["future"] = future
+                    self._jobs[job_id] = job
+                    break
+            # 进程池已损坏（工作进程异常退出），重建后重试一次
+            self.rebuild(executor)
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def is_broken(self):
+        """进程池是否因工作进程异常退出而不可再用"""
+        with self._lock:
+            return self._executor is not None and bool(self._executor._broken)
+
+    def recover(self, timeout=None):
+        """进程池已损坏时重建并等待预热完成
+
+        Returns:
+            进程池可用时返回True，重建后预热失败或超时返回False
+        """
+        with self._lock:
+            executor = self._executor
+            if executor is None or not executor._broken:
+                return True
+        self.rebuild(executor)
+        try:
+            return self.wait_ready(timeout) and not self.is_broken()
+        except RuntimeError:
+            return False
+
+    def rebuild(self, broken=None):
+        """关闭已损坏的进程池，重新创建进程池并预热工作进程
+
+        Args:
+            broken: 发现损坏的进程池，已被其他线程重建时不再重复重建
+        """
+        with self._lock:
+            if broken is not None and self._executor is not broken:
+                return
+            stale = (self._executor, self._progress_channel, self._progress_reader)
+            self._executor = None
+            self._progress_channel = None
+            self._progress_reader = None
+            self._ready = 0
+        if stale[0] is not None:
+            logger.warning("渲染进程异常退出，重新创建渲染进程池")
+            self._close(*stale, wait=False, cancel_pending=True)
+        self.start()
+
+    def _on_done(self, job_id, future):
+        """任务结束回调，记录结果或错误信息"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["finished_at"] = time.time()
+            if future.cancelled():
+                job["status"] = "failed"
+                job["error"] = "任务已取消"
+            elif isinstance(future.exception(), BrokenProcessPool):
+                job["status"] = "failed"
+                job["error"] = "渲染进程异常退出（可能内存不足），请稍后重试"
+            elif future.exception() is not None:
+                job["status"] = "failed"
+                job["error"] = str(future.exception())
+            else:
+                job["status"] = "finished"
+                job["result"] = future.result()
+            job["version"] += 1
+            self._updated.notify_all()
+            snapshot = {k: v for k, v in job.items() if k != "future"}
+        if self._on_finished is not None:
+            self._on_finished(snapshot)
+
+    def _purge_expired(self):
+        """清理过期的已完成任务（调用方需持有锁）"""
+        cutoff = time.time() - self.JOB_TTL
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _snapshot(self, job):
+        """任务状态快照（调用方需持有锁）"""
+        snapshot = {k: v for k, v in job.items() if k != "future"}
+        if snapshot["status"] == "queued" and (
+            job["future"].running() or job["progress"] is not None
+        ):
+            snapshot["status"] = "running"
+        return snapshot
+
+    def get_job(self, job_id):
+        """获取任务状态快照，不存在时返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return self._snapshot(job)
+
+    def wait_for_update(self, job_id, version, timeout):
+        """等待任务的状态或进度在version之后发生变化
+
+        Returns:
+            任务状态快照（超时时为当前状态），任务不存在时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job["version"] <= version:
+                self._updated.wait_for(
+                    lambda: self._jobs.get(job_id) is None
+                    or self._jobs[job_id]["version"] > version,
+                    timeout,
+                )
+                job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return self._snapshot(job)
+
+    def _close(self, executor, channel, reader, wait, cancel_pending):
+        """关闭进程池及其进度队列和读取进度的后台线程"""
+        executor.shutdown(wait=wait, cancel_futures=cancel_pending)
+        # 结束读取进度的后台线程，等待其退出后再关闭队列
+        channel.put(None)
+        reader.join(timeout=5)
+        # 异常退出的进程可能持有队列的写锁，退出时不等待队列写入完成
+        channel.cancel_join_thread()
+        channel.close()
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """关闭进程池
+
+        Args:
+            cancel_pending: 是否取消尚未开始的任务（进行中的任务总会执行完）
+        """
+        with self._lock:
+            stale = (self._executor, self._progress_channel, self._progress_reader)
+            self._executor = None
+            self._progress_channel = None
+            self._progress_reader = None
+        if stale[0] is not None:
+            self._close(*stale, wait=wait, cancel_pending=cancel_pending)
@@ -0,0 +1,398 @@
+import os
+import gc
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from src.utils.video_editor import VideoEditor
+from src.utils.asset_store import asset_store
+from src.utils.audio_cache import prepare_all_audio
+from src.utils.template_cache import prepare_all_templates, video_duration
+from src.utils.layout_plan import ImageLayer, all_plans, load_plan, slot_values
+from src.utils.segmented_render import concat_segments, segment_workers, split_timeline
+from src.utils.stage_timer import StageTimer
+from src.utils import progress
+from src.utils.encoder_profiles import probe_host, profile_name
+from src.services.render_cache import RenderCacheService
+
+
+# 批量渲染时每个工作进程任务（一组）包含的视频数量
+BATCH_GROUP_SIZE = int(os.environ.get("BATCH_GROUP_SIZE", 4))
+
+
+def warm_up_worker():
+    """渲染工作进程启动时预热：探测编码环境，解码并缩放叠加图片、加载字体、预处理模板和背景音乐"""
+    probe_host()
+    plans = all_plans()
+    for plan in plans:
+        asset_store.warm_up(
+            plan.warm_up_images(),
+            # 文字按3倍分辨率绘制
+            font_sizes=[int(size * 3.0) for size in plan.font_sizes()],
+        )
+    # 模板按每个版式的画布尺寸和预览短视频的缩小尺寸预处理，
+    # 任何版式的第一个请求都不需要转码模板
+    sizes = set()
+    for plan in plans:
+        sizes.add((plan.width, plan.height))
+        sizes.add(plan.scaled_size(VideoEditor.PREVIEW_SCALE))
+    for templates in prepare_all_templates(sizes=sorted(sizes)).values():
+        for template in templates:
+            video_duration(template)
+    prepare_all_audio()
+    VideoEditor.logger.info(f"渲染进程预热完成: {os.getpid()}")
+
+
+def _image_width(layer, text_sizes):
+    """图片图层的宽度（随文字变化时取文字宽度加边距和最小宽度中的较大值）"""
+    width = layer.size[0]
+    if layer.fit_text:
+        width = max(width, text_sizes[layer.fit_text][0] + layer.fit_padding)
+    return width
+
+
+def _text_position(layer, text_size, canvas_width):
+    x, y = layer.position
+    text_width, text_height = text_size
+    if x == "center":
+        x = (canvas_width - text_width) // 2
+    if layer.box_height is not None:
+        y = y + (layer.box_height - text_height) // 2
+    return (x, y)
+
+
+def build_editor(params, video_path, audio_path, plan=None, template=None):
+    """按模板的渲染计划创建VideoEditor并添加全部叠加层（params中的文字需已规范化）
+
+    Args:
+        plan: 渲染计划，默认按 params["template_id"] 加载
+        template: 批量渲染时共享的已打开模板（见 VideoEditor.open_template）
+    """
+    plan = plan or load_plan(params.get("template_id"))
+    values = slot_values(params)
+
+    # 创建VideoEditor实例（编码配置：请求指定 > 模板版式指定 > 默认配置）
+    editor = VideoEditor(
+        video_path,
+        audio_path,
+        template=template,
+        encoder_profile=profile_name(params.get("encoder_profile"), plan.encoder_profile),
+        size=(plan.width, plan.height),
+    )
+    try:
+        # 获取视频总时长，如果打字机效果需要的时间更长，则通过循环来延长视频时长
+        total_duration = plan.output_duration(params, editor.video.duration)
+        if total_duration > editor.video.duration:
+            editor.loop_video(total_duration)
+
+        # 只有请求中的文字需要在此填入；居中和图片宽度依赖的文字先绘制以获取尺寸
+        texts = {layer.name: layer.render_text(values) for layer in plan.text_layers()}
+        fitted = {layer.fit_text for layer in plan.image_layers() if layer.fit_text}
+        text_sizes = {
+            layer.name: editor.create_text_image(
+                texts[layer.name], layer.font_size, layer.color, stroke_width=layer.stroke_width
+            ).size
+            for layer in plan.text_layers()
+            if layer.centered or layer.name in fitted
+        }
+
+        for layer in plan.layers:
+            end_time = total_duration if layer.end is None else layer.end
+            if isinstance(layer, ImageLayer):
+                size = layer.size
+                x, y = layer.position
+                if size is not None:
+                    size = (_image_width(layer, text_sizes), size[1])
+                if x == "center":
+                    width = size[0] if size is not None else asset_store.size(layer.path)[0]
+                    x = (plan.width - width) // 2
+                editor.add_image(
+                    layer.path,
+                    position=(x, y),
+                    size=size,
+                    start_time=layer.start,
+                    end_time=end_time,
+                )
+            else:
+                position = layer.position
+                if layer.name in text_sizes:
+                    position = _text_position(layer, text_sizes[layer.name], plan.width)
+                editor.add_text(
+                    texts[layer.name],
+                    position=position,
+                    font_size=layer.font_size,
+                    color=layer.color,
+                    start_time=layer.start,
+                    end_time=end_time,
+                    typewriter_effect=bool(layer.typing_speed),
+                    typing_speed=layer.typing_speed,
+                    rotation_angle=layer.rotation,
+                    stroke_width=layer.stroke_width,
+                )
+    except Exception:
+        editor.cleanup()
+        raise
+    return editor
+
+
+def _render_segment(params, video_path, audio_path, segment_path, start, end):
+    """在分段工作进程中渲染[start, end)区间的画面，返回分段文件路径和耗时统计"""
+    editor = build_editor(params, video_path, audio_path)
+    editor.render_segment(segment_path, start, end)
+    return segment_path, editor.timer.snapshot()
+
+
+def _render_segmented(editor, params, video_path, audio_path, output_path):
+    """把时间轴切分为整秒分段并行编码，再无损拼接并混入音轨"""
+    segments = split_timeline(editor.timeline_duration(), segment_workers())
+    if len(segments) < 2:
+        editor.render(output_path)
+        return
+
+    VideoEditor.logger.info(f"分段并行渲染: {segments}")
+    editor.timer.count("segments", len(segments))
+    editor.timer.count("overlays", len(editor.overlays))
+    work_dir = tempfile.mkdtemp(prefix="segments_", dir=os.path.dirname(output_path))
+    # 渲染进程中已有日志和读帧线程，使用spawn启动分段进程以免fork后死锁
+    context = multiprocessing.get_context("spawn")
+    # 各分段写入的帧数汇总后作为任务进度上报
+    segment_progress = progress.SegmentProgress(
+        context, int(round(editor.timeline_duration() * 24))
+    )
+    try:
+        # 当前进程等待分段的时间计入segment_wait阶段，分段进程的各阶段耗时完成后合并
+        with editor.timer.stage("segment_wait"):
+            with ProcessPoolExecutor(
+                max_workers=len(segments),
+                mp_context=context,
+                initializer=progress.install,
+                initargs=(segment_progress.channel,),
+            ) as pool:
+                futures = [
+                    pool.submit(
+                        progress.run_job,
+                        i,
+                        _render_segment,
+                        params,
+                        video_path,
+                        audio_path,
+                        os.path.join(work_dir, f"segment_{i:03d}.mp4"),
+                        start,
+                        end,
+                    )
+                    for i, (start, end) in enumerate(segments)
+                ]
+                # 分段编码期间在当前进程中编码整段音频
+                audio_out = os.path.join(work_dir, "audio.m4a")
+                editor.write_audio(audio_out)
+                editor.cleanup()
+                results = [future.result() for future in futures]
+        with editor.timer.stage("encode"):
+            concat_segments([path for path, _ in results], audio_out, output_path)
+        for _, timings in results:
+            # 帧数、叠加层数量和写入字节数按最终输出的视频计数
+            editor.timer.merge({
+                "stages": timings["stages"],
+                "counters": {
+                    name: value for name, value in timings["counters"].items()
+                    if name not in ("frames", "overlays", "bytes_written")
+                },
+            })
+        editor.timer.count("frames", int(round(editor.timeline_duration() * 24)))
+        editor.timer.count("bytes_written", os.path.getsize(output_path))
+    finally:
+        segment_progress.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _render_inputs(params, seed):
+    """规范化文字，确定模板视频、背景音乐和版式并解析编码配置
+
+    Web进程查找缓存和工作进程渲染使用相同的计算，保证相同的缓存键对应相同的画面。
+
+    Args:
+        seed: 未指定 params["seed"] 时选择背景音乐的seed
+    Returns:
+        (params, video_path, audio_path, plan)，params为规范化后的副本
+    """
+    params = dict(params)
+    for name in RenderCacheService.TEXT_FIELDS:
+        if name in params:
+            params[name] = RenderCacheService.normalize_text(params[name])
+    # 根据模板ID选择视频，背景音乐按audio_id或seed确定性选择
+    video_path = VideoEditor.select_video(params["template_id"])
+    audio_path = VideoEditor.select_audio(
+        params.get("audio_id"), seed=params.get("seed") or seed
+    )
+    plan = load_plan(params["template_id"])
+    params["encoder_profile"] = profile_name(
+        params.get("encoder_profile"), plan.encoder_profile
+    )
+    return params, video_path, audio_path, plan
+
+
+def find_cached(params, output_filename, seed=None):
+    """提交渲染任务之前在Web进程中查找相同内容的已渲染视频
+
+    Args:
+        seed: 未指定 params["seed"] 时选择背景音乐的seed，默认为店名
+            （批量渲染整组共用背景音乐，为模板ID）
+    Returns:
+        命中时把缓存链接为 output_filename 并返回结果，未命中返回None
+    """
+    params, video_path, audio_path, plan = _render_inputs(
+        params, seed or RenderCacheService.normalize_text(params["shop_name"])
+    )
+    render_cache = RenderCacheService()
+    cache_key = render_cache.make_key(params, video_path, audio_path, plan.digest)
+    os.makedirs("output", exist_ok=True)
+    if not render_cache.lookup(cache_key, os.path.join("output", output_filename)):
+        return None
+    return {"video_url": f"/download/{output_filename}", "cached": True}
+
+
+def render_video(params, output_filename):
+    """在工作进程中执行的渲染任务，返回生成的视频文件名"""
+    output_path = os.path.join("output", output_filename)
+    os.makedirs("output", exist_ok=True)
+
+    try:
+        # 背景音乐默认以店名为seed
+        params, video_path, audio_path, plan = _render_inputs(
+            params, RenderCacheService.normalize_text(params["shop_name"])
+        )
+
+        # 提交前已在Web进程中查找过缓存，这里处理排队期间其他任务刚写入的情况
+        render_cache = RenderCacheService()
+        cache_key = render_cache.make_key(params, video_path, audio_path, plan.digest)
+        if render_cache.lookup(cache_key, output_path):
+            VideoEditor.logger.info(f"命中渲染缓存: {cache_key}")
+            return {"video_url": f"/download/{output_filename}", "cached": True}
+
+        editor = build_editor(params, video_path, audio_path, plan)
+
+        # 渲染并保存视频
+        backend = params.get("render_backend", "moviepy")
+        if params.get("segmented") and backend == "moviepy":
+            _render_segmented(editor, params, video_path, audio_path, output_path)
+        else:
+            editor.render(output_path, backend=backend)
+        render_cache.store(cache_key, output_path)
+        return {
+            "video_url": f"/download/{output_filename}",
+            "cached": False,
+            "timings": editor.timer.snapshot(),
+        }
+
+    except Exception:
+        # 出错时也要清理资源
+        if "editor" in locals():
+            editor.cleanup()
+        gc.collect()
+        raise
+
+
+def render_preview(params, output_filename, kind="still"):
+    """在工作进程中渲染预览（与完整渲染使用相同的版式），不使用渲染缓存
+
+    Args:
+        kind: "still"为单张JPEG画面，"clip"为低分辨率低帧率的无声短视频
+            （按 VideoEditor.PREVIEW_SCALE 缩小版式，只截取开头几秒）
+    """
+    params = dict(params)
+    for name in RenderCacheService.TEXT_FIELDS:
+        params[name] = RenderCacheService.normalize_text(params[name])
+    output_path = os.path.join("output", output_filename)
+    os.makedirs("output", exist_ok=True)
+
+    try:
+        video_path = VideoEditor.select_video(params["template_id"])
+        audio_path = VideoEditor.select_audio(
+            params.get("audio_id"), seed=params.get("seed") or params["shop_name"]
+        )
+        plan = load_plan(params.get("template_id"))
+        if kind == "clip":
+            plan = plan.scaled(VideoEditor.PREVIEW_SCALE, asset_store.size)
+        editor = build_editor(params, video_path, audio_path, plan)
+        editor.render_preview(output_path, kind)
+        return {
+            "preview_url": f"/preview/{output_filename}",
+            "preview": kind,
+            "cached": False,
+            "timings": editor.timer.snapshot(),
+        }
+    except Exception:
+        if "editor" in locals():
+            editor.cleanup()
+        gc.collect()
+        raise
+
+
+def render_batch(params, items, output_filenames):
+    """在工作进程中渲染同一模板的一组视频
+
+    整组共享已打开的模板、背景音乐、版式和进程内的素材缓存，只启动一个
+    ffmpeg进程，模板只解码一次（批量渲染只支持ffmpeg方式）。单个视频的
+    文字出错不影响其他视频。
+
+    Args:
+        params: 整组共用的参数（template_id、encoder_profile、audio_id、seed）
+        items: 每个视频的文字字段
+        output_filenames: 与items一一对应的输出文件名
+    Returns:
+        dict: items为每个视频的结果（video_url和cached，或error），timings为整组的统计
+    """
+    timer = StageTimer()
+    # 整组使用同一首背景音乐（默认以模板ID为seed）
+    params, video_path, audio_path, plan = _render_inputs(params, params["template_id"])
+    render_cache = RenderCacheService()
+    os.makedirs("output", exist_ok=True)
+
+    results = [None] * len(items)
+    pending = []  # (序号, 参数, 输出路径, 缓存键)
+    for i, (item, output_filename) in enumerate(zip(items, output_filenames)):
+        item_params = dict(params)
+        for name in RenderCacheService.TEXT_FIELDS:
+            item_params[name] = RenderCacheService.normalize_text(item[name])
+        output_path = os.path.join("output", output_filename)
+        cache_key = render_cache.make_key(item_params, video_path, audio_path, plan.digest)
+        if render_cache.lookup(cache_key, output_path):
+            results[i] = {"video_url": f"/download/{output_filename}", "cached": True}
+        else:
+            pending.append((i, item_params, output_path, cache_key))
+
+    if pending:
+        template = VideoEditor.open_template(video_path, plan.width, plan.height)
+        editors = []
+        try:
+            for i, item_params, output_path, cache_key in pending:
+                try:
+                    editor = build_editor(item_params, video_path, audio_path, plan, template)
+                except Exception as e:
+                    results[i] = {"error": str(e)}
+                    continue
+                editors.append((i, editor, output_path, cache_key))
+            if editors:
+                try:
+                    VideoEditor.render_batch(
+                        [editor for _, editor, _, _ in editors],
+                        [output_path for _, _, output_path, _ in editors],
+                    )
+                except Exception as e:
+                    for i, _, _, _ in editors:
+                        results[i] = {"error": str(e)}
+                else:
+                    for i, _, output_path, cache_key in editors:
+                        render_cache.store(cache_key, output_path)
+                        results[i] = {
+                            "video_url": f"/download/{os.path.basename(output_path)}",
+                            "cached": False,
+                        }
+        finally:
+            for _, editor, _, _ in editors:
+                timer.merge(editor.timer.snapshot())
+            template.close()
+            gc.collect()
+
+    return {"items": results, "cached": False, "timings": timer.snapshot()}
@@ -0,0 +1,67 @@
+import os
+import time
+import threading
+
+
+class AssetIndex:
+    """素材目录的内存索引
+
+    文件列表缓存在内存中，只有目录的修改时间变化时才重新扫描，
+    并且最多每隔 check_interval 秒检查一次目录状态。
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, directory, extensions, check_interval=1.0):
+        self.directory = directory
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.check_interval = check_interval
+        self._files = []
+        self._by_id = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_directory(cls, directory, extensions):
+        """获取目录对应的共享索引实例"""
+        key = (os.path.abspath(directory), tuple(extensions))
+        with cls._instances_lock:
+            index = cls._instances.get(key)
+            if index is None:
+                index = cls(directory, extensions)
+                cls._instances[key] = index
+            return index
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        mtime = os.stat(self.directory).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        files = sorted(
+            f
+            for f in os.listdir(self.directory)
+            if f.lower().endswith(self.extensions)
+        )
+        self._files = files
+        self._by_id = {os.path.splitext(f)[0]: f for f in files}
+        self._mtime = mtime
+
+    def files(self):
+        """按文件名排序的素材文件列表"""
+        with self._lock:
+            self._refresh()
+            return list(self._files)
+
+    def path_for(self, asset_id):
+        """根据素材ID（不含扩展名的文件名）查找文件路径，不存在时返回None"""
+        with self._lock:
+            self._refresh()
+            filename = self._by_id.get(str(asset_id))
+        if filename is None:
+            return None
+        return os.path.join(self.directory, filename)
@@ -0,0 +1,117 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from moviepy.editor import ImageClip
+from moviepy.video.fx.resize import resizer
+
+from .logger import VideoLogger
+from .text_cache import get_font
+
+logger = VideoLogger()
+
+
+def _read_only(arr):
+    arr.setflags(write=False)
+    return arr
+
+
+class AssetStore:
+    """进程内的叠加图片缓存
+
+    图片只解码一次，原图和缩放后的像素都以只读NumPy数组保存，各请求直接
+    复用，不再每次通过 ImageClip(path) 和MoviePy的resize重新处理。
+    缩放结果与MoviePy的resize完全一致；按文字宽度变化的尺寸较多，
+    缩放结果只保留最近使用的 max_entries 个。
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.environ.get("ASSET_CACHE_ENTRIES", 64))
+        self._originals = {}  # (路径, 修改时间) -> (rgb, mask)
+        self._resized = OrderedDict()  # (路径, 修改时间, 尺寸) -> (rgb, mask)
+        self._lock = threading.Lock()
+
+    def _original(self, path):
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+        with self._lock:
+            cached = self._originals.get(key)
+        if cached is not None:
+            return key, cached
+
+        # 与 ImageClip(path) 相同的解码方式：带Alpha通道的图片拆分为RGB和遮罩
+        clip = ImageClip(path)
+        rgb = _read_only(np.ascontiguousarray(clip.img))
+        mask = _read_only(clip.mask.img) if clip.mask is not None else None
+        with self._lock:
+            self._originals[key] = (rgb, mask)
+        return key, (rgb, mask)
+
+    def size(self, path):
+        """图片原始尺寸 (宽, 高)"""
+        _, (rgb, _) = self._original(path)
+        return (rgb.shape[1], rgb.shape[0])
+
+    def image(self, path, size=None):
+        """获取图片的RGB数组和遮罩（没有Alpha通道时为None），均为只读
+
+        Args:
+            path: 图片路径
+            size: 目标尺寸 (宽, 高)，高为None时按原始宽高比计算
+        """
+        key, (rgb, mask) = self._original(path)
+        if size is None:
+            return rgb, mask
+
+        w, h = size
+        if h is None:
+            aspect_ratio = rgb.shape[0] / rgb.shape[1]
+            h = int(w * aspect_ratio)
+        if (w, h) == (rgb.shape[1], rgb.shape[0]):
+            return rgb, mask
+
+        resized_key = key + ((w, h),)
+        with self._lock:
+            cached = self._resized.get(resized_key)
+            if cached is not None:
+                self._resized.move_to_end(resized_key)
+                return cached
+
+        # 与MoviePy的resize保持一致（遮罩先量化为uint8再缩放）
+        resized_rgb = _read_only(resizer(rgb, (w, h)))
+        resized_mask = None
+        if mask is not None:
+            resized_mask = _read_only(
+                1.0 * resizer((255 * mask).astype("uint8"), (w, h)) / 255.0
+            )
+        with self._lock:
+            self._resized[resized_key] = (resized_rgb, resized_mask)
+            while len(self._resized) > self.max_entries:
+                self._resized.popitem(last=False)
+        return resized_rgb, resized_mask
+
+    def clip(self, path, size=None):
+        """由缓存的像素创建ImageClip（不复制数组）"""
+        rgb, mask = self.image(path, size)
+        clip = ImageClip(rgb)
+        if mask is not None:
+            clip = clip.set_mask(ImageClip(mask, ismask=True))
+        return clip
+
+    def warm_up(self, images=(), font_sizes=()):
+        """预先解码并缩放图片、加载字体
+
+        Args:
+            images: [(路径, 尺寸或None), ...]
+            font_sizes: 需要预先加载的字号（实际绘制字号）
+        """
+        for path, size in images:
+            try:
+                self.image(path, size)
+            except (OSError, ValueError) as e:
+                logger.warning(f"预加载图片失败 {path}: {str(e)}")
+        for font_size in font_sizes:
+            get_font(font_size)
+
+
+asset_store = AssetStore()
@@ -0,0 +1,98 @@
+import os
+import fcntl
+import subprocess
+
+from moviepy.config import get_setting
+
+from .logger import VideoLogger
+from .template_cache import file_hash
+
+logger = VideoLogger()
+
+# 预编码的背景音乐存放目录
+AUDIO_CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR", "cache/audio")
+# 背景音乐预先循环编码的时长（秒），输出视频不超过该时长时只需截取
+AUDIO_BED_SECONDS = int(os.environ.get("AUDIO_BED_SECONDS", 120))
+
+
+def prepared_audio_path(audio_path):
+    """预编码背景音乐的缓存路径，以源文件内容哈希和循环时长为键"""
+    digest = file_hash(audio_path)
+    return os.path.join(AUDIO_CACHE_DIR, f"{digest}_{AUDIO_BED_SECONDS}s.m4a")
+
+
+def prepare_audio_bed(audio_path):
+    """把背景音乐循环到 AUDIO_BED_SECONDS 秒并一次性编码为AAC（44.1kHz立体声）"""
+    target = prepared_audio_path(audio_path)
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    # 多个工作进程同时预处理同一首音乐时，只让一个进程执行编码
+    with open(target + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            if os.path.exists(target):
+                return target
+
+            tmp_path = f"{target}.{os.getpid()}.tmp.m4a"
+            cmd = [
+                get_setting("FFMPEG_BINARY"),
+                "-y",
+                "-loglevel",
+                "error",
+                "-stream_loop",
+                "-1",
+                "-i",
+                audio_path,
+                "-vn",
+                "-t",
+                str(AUDIO_BED_SECONDS),
+                "-c:a",
+                "aac",
+                "-b:a",
+                "128k",
+                "-ar",
+                "44100",
+                "-ac",
+                "2",
+                tmp_path,
+            ]
+            logger.info(f"预编码背景音乐: {audio_path} -> {target}")
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise RuntimeError(f"背景音乐预处理失败: {result.stderr.strip()[-300:]}")
+            os.replace(tmp_path, target)
+            return target
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def audio_track(audio_path, duration, output_path):
+    """从预编码的背景音乐中截取指定时长的音轨（直接复制AAC数据，不重新编码）"""
+    bed_path = prepare_audio_bed(audio_path)
+    cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error"]
+    if duration > AUDIO_BED_SECONDS:
+        cmd += ["-stream_loop", "-1"]
+    cmd += ["-i", bed_path, "-t", f"{duration:.3f}", "-c", "copy", output_path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"生成背景音轨失败: {result.stderr.strip()[-300:]}")
+    return output_path
+
+
+def prepare_all_audio(input_dir="asset/audio"):
+    """预编码目录下的所有背景音乐"""
+    prepared = {}
+    for f in sorted(os.listdir(input_dir)):
+        if f.lower().endswith((".mp3", ".wav")):
+            path = os.path.join(input_dir, f)
+            prepared[path] = prepare_audio_bed(path)
+    return prepared
+
+
+if __name__ == "__main__":
+    for source, target in prepare_all_audio().items():
+        print(f"{source} -> {target}")
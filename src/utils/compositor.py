@@ -0,0 +1,260 @@
+import cv2
+import numpy as np
+
+from .overlay_layer import StaticLayer, static_pixels
+from .interval_index import IntervalIndex
+from .typewriter_clip import TypewriterClip
+
+
+def _to_uint8(values):
+    """0-255的浮点数组四舍五入为uint8"""
+    return np.clip(values + 0.5, 0, 255).astype(np.uint8)
+
+
+# 叠加层按行分带处理，每带只混合Alpha不为0的列范围
+BAND_ROWS = 32
+# 同时显示的图层达到该数量时才预先合成（合成一次的开销约为混合一个大图层的数倍）
+MERGE_MIN_LAYERS = 3
+
+
+class _Sprite:
+    """裁剪到画面内的叠加层像素，按行分带并去掉完全透明的部分
+
+    pieces 中每一项为 (行切片, 列切片, 数据)：完全不透明的部分数据为
+    uint8的RGB，直接复制；其余部分数据为 (premul, inv_alpha)，premul 为
+    预乘Alpha的RGB，inv_alpha 为 255 - Alpha（扩展为3通道），均为uint8。
+    """
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+
+def _piece(rgb, alpha, premultiplied):
+    if (alpha == 255).all():
+        return np.ascontiguousarray(rgb)
+    if premultiplied:
+        premul = np.ascontiguousarray(rgb)
+    else:
+        a = alpha.astype(np.uint16)[..., None]
+        premul = ((rgb * a + 127) // 255).astype(np.uint8)
+    inv_alpha = np.repeat((255 - alpha)[..., None], 3, axis=2)
+    return (premul, inv_alpha)
+
+
+def _make_sprite(rgb, alpha, position, frame_size, premultiplied=False):
+    """把RGB（uint8）和Alpha（uint8）裁剪到画面内并转换为混合用的整数数组
+
+    Args:
+        premultiplied: rgb 是否已经是预乘Alpha后的颜色
+    Returns:
+        _Sprite，完全在画面外或完全透明时返回None
+    """
+    fw, fh = frame_size
+    x, y = (int(v) for v in position)
+    h, w = alpha.shape
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(fw, x + w), min(fh, y + h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+
+    pieces = []
+    for top in range(y0, y1, BAND_ROWS):
+        bottom = min(top + BAND_ROWS, y1)
+        band_alpha = alpha[top - y : bottom - y, x0 - x : x1 - x]
+        columns = np.flatnonzero(band_alpha.any(axis=0))
+        if not len(columns):
+            continue
+        left, right = x0 + columns[0], x0 + columns[-1] + 1
+        src = (slice(top - y, bottom - y), slice(left - x, right - x))
+        pieces.append(
+            (
+                slice(top, bottom),
+                slice(left, right),
+                _piece(rgb[src], alpha[src], premultiplied),
+            )
+        )
+    return _Sprite(pieces) if pieces else None
+
+
+class _StaticEntry:
+    """整个显示时段内像素不变的图层"""
+
+    def __init__(self, layer, sprite):
+        self.start = layer.start
+        self.end = layer.end
+        self.sprite = sprite
+
+    def state(self, t):
+        return None
+
+    def sprite_at(self, t):
+        return self.sprite
+
+
+class _TypewriterEntry:
+    """打字机文字：已显示的字符数变化时才重新计算遮罩"""
+
+    def __init__(self, clip, frame_size):
+        self.start = clip.start
+        self.end = clip.end
+        self.clip = clip
+        self.frame_size = frame_size
+        self.position = clip.pos(0)
+        self._state = (None, None)  # (已显示字符数, _Sprite)
+
+    def state(self, t):
+        """已显示的字符数，只在每个字符出现时变化"""
+        return self.clip.visible_count(t - self.start)
+
+    def sprite_at(self, t):
+        ct = t - self.start
+        count = self.clip.visible_count(ct)
+        if self._state[0] != count:
+            alpha = _to_uint8(self.clip.mask.get_frame(ct) * 255.0)
+            sprite = _make_sprite(self.clip.rgb, alpha, self.position, self.frame_size)
+            self._state = (count, sprite)
+        return self._state[1]
+
+
+class Compositor:
+    """整数运算的叠加层合成器，替代MoviePy的CompositeVideoClip
+
+    整个渲染过程只使用一块预先分配的uint8画面缓冲区：每帧先复制模板
+    视频的画面，再按叠放顺序只在各叠加层不透明的区域内原地混合
+    out = premul + dst * (255 - a) / 255（预乘Alpha，uint8饱和运算，
+    由OpenCV完成）。与MoviePy逐层分配整帧浮点数组相比，每帧没有整帧
+    大小的内存分配，结果与MoviePy最多相差1个色阶。
+
+    叠加层的画面只在图层状态（显示的图层及打字机已显示的字数）变化时
+    改变：同时显示的图层较多时，状态变化时把全部叠加层预先合成为一个
+    图层并缓存，状态不变的各帧只需混合一次。无法预先取得像素的叠加层
+    仍交给MoviePy的blit_on逐层处理。
+    """
+
+    def __init__(self, background, layers, frame_size):
+        """
+        Args:
+            background: 模板视频clip（已循环到所需时长）
+            layers: 叠加层，StaticLayer或MoviePy clip（见 overlay_layer.flatten_overlays）
+            frame_size: 画面尺寸 (宽, 高)
+        """
+        self.background = background
+        self.frame_size = frame_size
+        fw, fh = frame_size
+        self._frame = np.zeros((fh, fw, 3), dtype=np.uint8)
+        # 混合时的中间结果，按叠加层区域取视图使用
+        self._scratch = np.empty((fh, fw, 3), dtype=np.uint8)
+        # 合成叠加层用的预乘Alpha画布和 255 - Alpha
+        self._canvas = np.empty((fh, fw, 3), dtype=np.uint8)
+        self._canvas_inv = np.empty((fh, fw, 3), dtype=np.uint8)
+        self._overlay = (None, None)  # (图层状态, 合成后的_Sprite)
+        # 按显示时段索引，每帧只需一次二分查找即可得到需要混合的图层
+        self.index = IntervalIndex(self._entry(layer) for layer in layers)
+
+    def _entry(self, layer):
+        if isinstance(layer, StaticLayer):
+            sprite = _make_sprite(
+                layer.rgb, layer.alpha, layer.position, self.frame_size, premultiplied=True
+            )
+            return _StaticEntry(layer, sprite)
+        if isinstance(layer, TypewriterClip):
+            return _TypewriterEntry(layer, self.frame_size)
+        pixels = static_pixels(layer)
+        if pixels is not None:
+            sprite = _make_sprite(
+                _to_uint8(pixels["rgb"]),
+                _to_uint8(pixels["alpha"] * 255.0),
+                pixels["bbox"][:2],
+                self.frame_size,
+            )
+            return _StaticEntry(layer, sprite)
+        return layer
+
+    def _blend(self, sprite):
+        for rows, cols, data in sprite.pieces:
+            dst = self._frame[rows, cols]
+            if not isinstance(data, tuple):
+                # 完全不透明
+                np.copyto(dst, data)
+                continue
+            premul, inv_alpha = data
+            h, w = dst.shape[:2]
+            scratch = self._scratch[:h, :w]
+            cv2.multiply(dst, inv_alpha, dst=scratch, scale=1 / 255)
+            cv2.add(scratch, premul, dst=dst)
+
+    def _state_key(self, t, entries):
+        """时间t的图层状态，有无法预先合成的图层时返回None"""
+        key = [self.index.state_at(t)]
+        for entry in entries:
+            if not isinstance(entry, (_StaticEntry, _TypewriterEntry)):
+                return None
+            key.append(entry.state(t))
+        return tuple(key)
+
+    def _flatten(self, t, entries):
+        """把当前显示的全部叠加层按叠放顺序合成为一个预乘Alpha图层
+
+        结果可能引用内部画布，下一次合成时失效（只缓存最近一个状态）。
+        """
+        sprites = [entry.sprite_at(t) for entry in entries]
+        sprites = [sprite for sprite in sprites if sprite is not None]
+        if not sprites:
+            return None
+        if len(sprites) == 1:
+            return sprites[0]
+
+        pieces = [piece for sprite in sprites for piece in sprite.pieces]
+        y0 = min(rows.start for rows, _, _ in pieces)
+        y1 = max(rows.stop for rows, _, _ in pieces)
+        x0 = min(cols.start for _, cols, _ in pieces)
+        x1 = max(cols.stop for _, cols, _ in pieces)
+        self._canvas[y0:y1, x0:x1] = 0
+        self._canvas_inv[y0:y1, x0:x1] = 255
+        for rows, cols, data in pieces:
+            canvas = self._canvas[rows, cols]
+            canvas_inv = self._canvas_inv[rows, cols]
+            if not isinstance(data, tuple):
+                np.copyto(canvas, data)
+                canvas_inv[...] = 0
+                continue
+            # 预乘Alpha的over运算：颜色 = 上层 + 下层 * (1 - a)，1 - Alpha相乘
+            premul, inv_alpha = data
+            h, w = canvas.shape[:2]
+            scratch = self._scratch[:h, :w]
+            cv2.multiply(canvas, inv_alpha, dst=scratch, scale=1 / 255)
+            cv2.add(scratch, premul, dst=canvas)
+            cv2.multiply(canvas_inv, inv_alpha, dst=canvas_inv, scale=1 / 255)
+        return _make_sprite(
+            self._canvas[y0:y1, x0:x1],
+            255 - self._canvas_inv[y0:y1, x0:x1, 0],
+            (x0, y0),
+            self.frame_size,
+            premultiplied=True,
+        )
+
+    def frame(self, t):
+        """合成时间t的画面
+
+        返回的数组是内部缓冲区，下一次调用时会被覆盖，需要保留时请复制。
+        """
+        np.copyto(self._frame, self.background.get_frame(t), casting="unsafe")
+        entries = self.index.active(t)
+        key = None
+        if len(entries) >= MERGE_MIN_LAYERS:
+            key = self._state_key(t, entries)
+        if key is not None:
+            if self._overlay[0] != key:
+                self._overlay = (key, self._flatten(t, entries))
+            if self._overlay[1] is not None:
+                self._blend(self._overlay[1])
+            return self._frame
+
+        for entry in entries:
+            if isinstance(entry, (_StaticEntry, _TypewriterEntry)):
+                sprite = entry.sprite_at(t)
+                if sprite is not None:
+                    self._blend(sprite)
+            else:
+                self._frame[...] = entry.blit_on(self._frame, t)
+        return self._frame
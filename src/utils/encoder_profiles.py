@@ -0,0 +1,166 @@
+import os
+import math
+import functools
+
+from .logger import VideoLogger
+
+logger = VideoLogger()
+
+# 编码配置（速度、画质和文件大小的取舍）
+#   preview:  速度最快，画质较低，用于预览
+#   standard: 固定1500k码率、低延迟调优（原来的默认参数）
+#   archive:  CRF恒定画质、更慢的预设和更多B帧，画质更好且文件更小
+# preset为libx264的预设，nvenc_preset为使用NVENC硬件编码时的预设；
+# crf为None时使用固定码率bitrate；sc_threshold为0时关闭场景切换检测，保证关键帧间隔固定
+ENCODER_PROFILES = {
+    "preview": {
+        "preset": "ultrafast",
+        "nvenc_preset": "p1",
+        "crf": 32,
+        "bitrate": None,
+        "tune": "zerolatency",
+        "bframes": 0,
+        "gop": 48,
+        "sc_threshold": 0,
+    },
+    "standard": {
+        "preset": "veryfast",
+        "nvenc_preset": "p2",
+        "crf": None,
+        "bitrate": "1500k",
+        "tune": "zerolatency",
+        "bframes": 1,
+        "gop": 24,
+        "sc_threshold": 0,
+    },
+    "archive": {
+        "preset": "medium",
+        "nvenc_preset": "p5",
+        "crf": 21,
+        "bitrate": None,
+        "tune": None,
+        "bframes": 3,
+        "gop": 48,
+        "sc_threshold": None,
+    },
+}
+
+# 请求和版式都未指定时使用的编码配置
+DEFAULT_PROFILE = os.environ.get("ENCODER_PROFILE", "standard")
+# x264超过16个线程后基本没有收益
+MAX_ENCODER_THREADS = 16
+
+
+def _cgroup_cpu_limit():
+    """容器CPU配额对应的核数（cgroup v2或v1），没有限制时返回None"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota == "max":
+            return None
+        return math.ceil(int(quota) / int(period))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota <= 0:
+            return None
+        return math.ceil(quota / period)
+    except (OSError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def host_cpus():
+    """当前进程实际可用的CPU核数（考虑CPU亲和性和容器配额），只探测一次"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit:
+        cpus = min(cpus, limit)
+    return max(1, cpus)
+
+
+@functools.lru_cache(maxsize=None)
+def cuda_available():
+    """是否使用NVENC硬件编码，只探测一次（ENCODER_DEVICE=cpu时总是使用CPU）"""
+    if os.environ.get("ENCODER_DEVICE", "auto") == "cpu":
+        return False
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+def encoder_threads():
+    """每个编码进程的线程数：环境变量 ENCODER_THREADS，默认为可用核数（最多16）"""
+    threads = os.environ.get("ENCODER_THREADS")
+    if threads:
+        return max(1, int(threads))
+    return min(host_cpus(), MAX_ENCODER_THREADS)
+
+
+def probe_host():
+    """在进程启动时探测并缓存主机的编码能力"""
+    info = {"cpus": host_cpus(), "cuda": cuda_available(), "threads": encoder_threads()}
+    logger.info(
+        f"编码环境: 可用CPU {info['cpus']}核, 编码线程 {info['threads']}, "
+        f"{'NVENC硬件编码' if info['cuda'] else 'CPU编码'}"
+    )
+    return info
+
+
+def profile_name(requested=None, template_default=None):
+    """确定使用的编码配置：请求指定 > 模板版式指定 > 默认配置"""
+    name = requested or template_default or DEFAULT_PROFILE
+    if name not in ENCODER_PROFILES:
+        raise ValueError(f"不支持的编码配置: {name}")
+    return name
+
+
+def _codec_params(profile, use_cuda):
+    """码率控制和GOP等编码参数（libx264专用的参数在硬件编码时不使用）"""
+    params = []
+    if profile["crf"] is not None:
+        params += ["-cq", str(profile["crf"])] if use_cuda else ["-crf", str(profile["crf"])]
+    if profile["tune"] and not use_cuda:
+        params += ["-tune", profile["tune"]]
+    params += ["-movflags", "+faststart", "-bf", str(profile["bframes"]), "-g", str(profile["gop"])]
+    if profile["sc_threshold"] is not None and not use_cuda:
+        params += ["-sc_threshold", str(profile["sc_threshold"])]
+    return params
+
+
+def moviepy_options(name=None):
+    """write_videofile使用的视频编码参数"""
+    profile = ENCODER_PROFILES[profile_name(name)]
+    use_cuda = cuda_available()
+    return dict(
+        codec="h264_nvenc" if use_cuda else "libx264",
+        preset=profile["nvenc_preset"] if use_cuda else profile["preset"],
+        threads=encoder_threads(),
+        bitrate=profile["bitrate"],
+        ffmpeg_params=_codec_params(profile, use_cuda),
+    )
+
+
+def ffmpeg_args(name=None):
+    """ffmpeg命令行中输出视频的编码参数"""
+    profile = ENCODER_PROFILES[profile_name(name)]
+    use_cuda = cuda_available()
+    args = [
+        "-c:v",
+        "h264_nvenc" if use_cuda else "libx264",
+        "-preset",
+        profile["nvenc_preset"] if use_cuda else profile["preset"],
+    ]
+    if profile["bitrate"]:
+        args += ["-b:v", profile["bitrate"]]
+    args += ["-threads", str(encoder_threads()), "-pix_fmt", "yuv420p"]
+    return args + _codec_params(profile, use_cuda)
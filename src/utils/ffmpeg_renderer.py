@@ -0,0 +1,247 @@
+import os
+import hashlib
+import subprocess
+import tempfile
+
+import numpy as np
+from PIL import Image
+from moviepy.config import get_setting
+
+from .overlay_layer import (
+    StaticLayer,
+    clip_frame_rgba,
+    flatten_overlays,
+    static_pixels,
+)
+from .typewriter_clip import TypewriterClip
+from .encoder_profiles import ffmpeg_args
+from . import progress
+
+
+def run_ffmpeg(cmd, total_frames):
+    """执行ffmpeg命令，通过 -progress 读取已编码的帧数并上报为任务进度
+
+    Returns:
+        (返回码, 错误输出)
+    """
+    cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True)
+        for line in proc.stdout:
+            if line.startswith("frame="):
+                try:
+                    progress.frames(int(line[6:]), total_frames)
+                except ValueError:
+                    pass
+        returncode = proc.wait()
+        stderr.seek(0)
+        return returncode, stderr.read().decode("utf-8", "replace")
+
+
+class FFmpegRenderer:
+    """将叠加层转换为ffmpeg的filter_complex，由单个ffmpeg进程完成合成和编码
+
+    静态图层和文字导出为PNG，通过overlay滤镜的enable表达式控制显示时段；
+    打字机文字只导出一张整段文字的PNG，按字符区域裁剪后逐个定时叠加。
+    整个过程中像素数据不经过Python解释器。
+    """
+
+    def __init__(self, editor):
+        self.editor = editor
+        self.width = editor.width
+        self.height = editor.height
+        self.fps = 24
+
+    def _write_png(self, rgb, alpha, path):
+        """保存RGBA图片（rgb为0-255，alpha为0-1）"""
+        rgba = np.dstack(
+            [
+                np.clip(rgb + 0.5, 0, 255).astype(np.uint8),
+                np.clip(alpha * 255.0 + 0.5, 0, 255).astype(np.uint8),
+            ]
+        )
+        Image.fromarray(rgba, "RGBA").save(path, compress_level=1)
+
+    @staticmethod
+    def _enable(start, end):
+        return f"gte(t,{start:.3f})*lt(t,{end:.3f})"
+
+    def _collect_layers(self, workdir):
+        """把叠加层整理为 (图片路径, x, y, 显示时段, 裁剪区域) 列表"""
+        layers = []
+        overlays = flatten_overlays(self.editor.overlays, (self.width, self.height))
+        for index, layer in enumerate(overlays):
+            path = os.path.join(workdir, f"layer_{index}.png")
+
+            if isinstance(layer, StaticLayer):
+                rgba = np.dstack([layer.straight_rgb(), layer.alpha])
+                Image.fromarray(rgba, "RGBA").save(path, compress_level=1)
+                x, y = layer.position
+                layers.append((path, x, y, layer.start, layer.end, None))
+                continue
+
+            if isinstance(layer, TypewriterClip):
+                layers.extend(self._typewriter_layers(layer, path))
+                continue
+
+            pixels = static_pixels(layer)
+            if pixels is None:
+                raise ValueError(
+                    f"ffmpeg渲染不支持该叠加层类型: {type(layer).__name__}"
+                )
+            self._write_png(pixels["rgb"], pixels["alpha"], path)
+            x, y = pixels["bbox"][:2]
+            layers.append((path, x, y, layer.start, layer.end, None))
+        return layers
+
+    def _typewriter_layers(self, clip, path):
+        x, y = (int(v) for v in clip.pos(0))
+        steps = [clip.start + t for t in clip.step_times]
+
+        if getattr(clip, "rotation_angle", 0):
+            # 旋转后的文字无法按矩形区域裁剪，逐步导出完整状态图片
+            layers = []
+            base, ext = os.path.splitext(path)
+            for i, step_start in enumerate(steps):
+                step_end = steps[i + 1] if i + 1 < len(steps) else clip.end
+                if step_end <= step_start:
+                    continue
+                rgb, alpha = clip_frame_rgba(clip, step_start - clip.start)
+                step_path = f"{base}_{i}{ext}"
+                self._write_png(rgb, alpha, step_path)
+                layers.append((step_path, x, y, step_start, step_end, None))
+            return layers
+
+        self._write_png(clip.rgb.astype(np.float32), clip.alpha, path)
+        layers = []
+        for box, step_start in zip(clip.boxes, steps):
+            if box is None or box[2] <= box[0] or box[3] <= box[1]:
+                continue
+            layers.append((path, x, y, step_start, clip.end, box))
+        return layers
+
+    def build_command(self, layers, duration, output_path):
+        """生成ffmpeg命令行"""
+        return self.build_batch_command([(layers, duration, output_path)])
+
+    def build_batch_command(self, outputs):
+        """生成一次解码模板、同时输出多个视频的ffmpeg命令行
+
+        Args:
+            outputs: [(叠加层列表, 时长, 输出路径), ...]，共享模板视频和背景音乐
+        """
+        editor = self.editor
+        cmd = [
+            get_setting("FFMPEG_BINARY"),
+            "-y",
+            "-loglevel",
+            "error",
+            "-stream_loop",
+            "-1",
+            "-i",
+            editor.video_path,
+            "-stream_loop",
+            "-1",
+            "-i",
+            editor.audio_bed,
+        ]
+
+        # 同一张图片只作为一个输入，多次使用时通过split复用
+        inputs = []
+        uses = {}
+        for layers, _, _ in outputs:
+            for layer in layers:
+                if layer[0] not in uses:
+                    inputs.append(layer[0])
+                uses[layer[0]] = uses.get(layer[0], 0) + 1
+        for path in inputs:
+            cmd += ["-i", path]
+
+        # 多个输出时模板画面解码一次后通过split分给各个输出
+        prefixes = [f"o{k}_" for k in range(len(outputs))] if len(outputs) > 1 else [""]
+        base = f"[0:v]scale={self.width}:{self.height},fps={self.fps},setsar=1"
+        if len(outputs) > 1:
+            base += f",split={len(outputs)}"
+        filters = [base + "".join(f"[{prefix}bg0]" for prefix in prefixes)]
+        sources = {}
+        for n, path in enumerate(inputs):
+            label = f"{n + 2}:v"
+            if uses[path] > 1:
+                outs = [f"in{n}_{k}" for k in range(uses[path])]
+                filters.append(
+                    f"[{label}]split={uses[path]}" + "".join(f"[{o}]" for o in outs)
+                )
+                sources[path] = outs
+            else:
+                sources[path] = [label]
+
+        output_args = []
+        for prefix, (layers, duration, output_path) in zip(prefixes, outputs):
+            current = f"{prefix}bg0"
+            for i, (path, x, y, start, end, box) in enumerate(layers):
+                src = sources[path].pop(0)
+                if box is not None:
+                    x0, y0, x1, y1 = box
+                    filters.append(
+                        f"[{src}]crop={x1 - x0}:{y1 - y0}:{x0}:{y0}[{prefix}crop{i}]"
+                    )
+                    src = f"{prefix}crop{i}"
+                    x, y = x + x0, y + y0
+                out = f"{prefix}bg{i + 1}"
+                filters.append(
+                    f"[{current}][{src}]overlay=x={x}:y={y}"
+                    f":enable='{self._enable(start, end)}'[{out}]"
+                )
+                current = out
+            output_args += ["-map", f"[{current}]", "-map", "1:a", "-t", f"{duration:.3f}"]
+            output_args += self._encode_args() + [output_path]
+
+        return cmd + ["-filter_complex", ";".join(filters)] + output_args
+
+    def _encode_args(self):
+        """每个输出视频的编码参数"""
+        # 背景音乐已预编码为AAC，直接复制
+        return ffmpeg_args(self.editor.encoder_profile) + ["-c:a", "copy"]
+
+    def render(self, output_path, duration):
+        with tempfile.TemporaryDirectory(prefix="ffmpeg_render_") as workdir:
+            layers = self._collect_layers(workdir)
+            cmd = self.build_command(layers, duration, output_path)
+            returncode, stderr = run_ffmpeg(cmd, int(round(duration * self.fps)))
+            if returncode != 0:
+                raise RuntimeError(f"ffmpeg渲染失败: {stderr.strip()[-500:]}")
+
+
+def render_batch(editors, output_paths):
+    """用一个ffmpeg进程同时渲染多个使用相同模板和背景音乐的视频
+
+    模板只解码一次；各视频中内容相同的叠加图片（如不含请求文字的静态图层）
+    只作为一个输入。
+    """
+    renderer = FFmpegRenderer(editors[0])
+    for editor in editors[1:]:
+        if (editor.video_path, editor.audio_bed) != (
+            renderer.editor.video_path,
+            renderer.editor.audio_bed,
+        ):
+            raise ValueError("批量渲染的视频必须使用相同的模板和背景音乐")
+
+    with tempfile.TemporaryDirectory(prefix="ffmpeg_batch_") as workdir:
+        shared = {}  # 图片内容哈希 -> 第一次出现的路径
+        outputs = []
+        for k, (editor, output_path) in enumerate(zip(editors, output_paths)):
+            item_dir = os.path.join(workdir, str(k))
+            os.makedirs(item_dir)
+            layers = []
+            for layer in FFmpegRenderer(editor)._collect_layers(item_dir):
+                with open(layer[0], "rb") as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()
+                layers.append((shared.setdefault(digest, layer[0]),) + layer[1:])
+            outputs.append((layers, editor.timeline_duration(), output_path))
+
+        cmd = renderer.build_batch_command(outputs)
+        # 各输出同步编码，进度按最长的视频计算
+        total_frames = int(round(max(duration for _, duration, _ in outputs) * renderer.fps))
+        returncode, stderr = run_ffmpeg(cmd, total_frames)
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg批量渲染失败: {stderr.strip()[-500:]}")
@@ -0,0 +1,62 @@
+import os
+import math
+
+# 每次渲染缓存的模板画面总大小上限（MB），整段模板画面超过上限时不缓存
+FRAME_CACHE_MB = int(os.environ.get("FRAME_CACHE_MB", 1024))
+
+
+def loop_cache_bytes(duration, fps, size):
+    """缓存一遍模板画面（RGB）所需的字节数，超过 FRAME_CACHE_MB 时返回0
+
+    只缓存一部分画面时，之后每一遍超出缓存的部分仍要重新定位和解码，
+    几乎没有收益，因此要么缓存整段模板，要么不缓存。
+
+    Args:
+        duration: 模板视频时长（秒）
+        fps: 模板视频帧率
+        size: 画面尺寸 (宽, 高)
+    """
+    needed = (math.ceil(duration * fps) + 1) * size[0] * size[1] * 3
+    return needed if needed <= FRAME_CACHE_MB * 1024 * 1024 else 0
+
+
+class LoopFrameCache:
+    """循环播放的模板画面缓存
+
+    模板视频循环播放时，每一遍都需要MoviePy的读帧进程重新定位到开头并
+    再次解码。第一遍解码的画面按帧序号保存，之后各遍直接复用。max_bytes
+    按整段模板的大小设置（见 loop_cache_bytes），超出时不再缓存新画面。
+    缓存的画面在多次调用间共享，调用方不得原地修改。
+    """
+
+    def __init__(self, fps, max_bytes):
+        self.fps = fps
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self._frames = {}  # 帧序号 -> 画面
+        self._bytes = 0
+
+    def frame_index(self, t):
+        """时间t对应的帧序号（与MoviePy读帧时的取整方式一致）"""
+        return int(self.fps * t + 0.00001)
+
+    def filter(self, get_frame, t):
+        """用于 clip.fl 的画面过滤函数，t为模板视频内的时间"""
+        index = self.frame_index(t)
+        frame = self._frames.get(index)
+        if frame is not None:
+            self.hits += 1
+            return frame
+        frame = get_frame(t)
+        if self._bytes + frame.nbytes <= self.max_bytes:
+            self._frames[index] = frame
+            self._bytes += frame.nbytes
+        return frame
+
+    def wrap(self, clip):
+        """返回从缓存读取画面的clip（需在循环之前包装，循环后的时间已映射回模板内）"""
+        return clip.fl(self.filter)
+
+    def clear(self):
+        self._frames.clear()
+        self._bytes = 0
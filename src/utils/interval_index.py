@@ -0,0 +1,39 @@
+from bisect import bisect_right
+
+
+class IntervalIndex:
+    """按显示时段索引的叠加层
+
+    所有起止时间把时间轴切分为若干区间，每个区间内显示的叠加层集合
+    （图层状态）不变。构建时预先计算各区间的图层状态，查询时间t时
+    只需一次二分查找，与叠加层数量无关。
+
+    叠加层需要有 start 和 end 属性（end为None表示一直显示），
+    显示时段为 [start, end)，与MoviePy的 is_playing 一致。
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+        # 区间边界，第i个区间为 [boundaries[i - 1], boundaries[i])
+        self.boundaries = sorted(
+            {item.start for item in self.items}
+            | {item.end for item in self.items if item.end is not None}
+        )
+        # 第0个区间在第一个边界之前，没有叠加层显示
+        self.states = [()]
+        for start in self.boundaries:
+            self.states.append(
+                tuple(
+                    item
+                    for item in self.items
+                    if item.start <= start and (item.end is None or start < item.end)
+                )
+            )
+
+    def state_at(self, t):
+        """时间t所在区间的序号，序号相同的时间显示的叠加层相同"""
+        return bisect_right(self.boundaries, t)
+
+    def active(self, t):
+        """时间t显示的叠加层（保持添加顺序，即叠放顺序）"""
+        return self.states[self.state_at(t)]
@@ -0,0 +1,342 @@
+import os
+import json
+import string
+import hashlib
+import functools
+from dataclasses import dataclass, replace
+
+from .encoder_profiles import ENCODER_PROFILES
+
+# 版式文件目录：<模板ID>.json 对应单个模板，没有时使用 default.json
+LAYOUT_DIR = os.environ.get("LAYOUT_DIR", "src/layouts")
+DEFAULT_LAYOUT = "default"
+
+# 版式中可以引用的文字字段，另外可以用 <字段>_length 引用字段的字数
+TEXT_SLOTS = ("shop_name", "left_comment", "right_comment", "bottom_comment")
+
+
+def wrap_text(text, chars_per_line):
+    """保留手动换行，超过每行字数的行自动换行（丢弃空行）"""
+    if not chars_per_line:
+        return text
+    formatted_lines = []
+    for line in text.split("\n"):
+        while len(line) > chars_per_line:
+            formatted_lines.append(line[:chars_per_line])
+            line = line[chars_per_line:]
+        if line:
+            formatted_lines.append(line)
+    return "\n".join(formatted_lines)
+
+
+def slot_values(params):
+    """请求中可供版式引用的文字及字数"""
+    values = {}
+    for name in TEXT_SLOTS:
+        text = params.get(name) or ""
+        values[name] = text
+        values[f"{name}_length"] = len(text)
+    return values
+
+
+@dataclass(frozen=True)
+class ImageLayer:
+    """图片叠加层
+
+    size 的高度为 None 时保持原始宽高比；fit_text 指定文字图层名时，
+    图片宽度取 max(size宽度, 文字宽度 + fit_padding)。
+    position 的x为 "center" 时水平居中。
+    """
+
+    name: str
+    path: str
+    position: tuple
+    size: tuple = None
+    fit_text: str = None
+    fit_padding: int = 0
+    start: float = 0
+    end: float = None  # None表示到视频结束
+
+
+@dataclass(frozen=True)
+class TextLayer:
+    """文字叠加层
+
+    text 是 str.format 模板，只在请求时填入文字字段。position 的x为 "center"
+    时水平居中；设置 box_height 时在 [y, y + box_height] 内垂直居中。
+    设置 typing_speed 时使用打字机效果，输出视频至少持续
+    字数 * typing_speed + typing_hold 秒。
+    """
+
+    name: str
+    text: str
+    font_size: int
+    position: tuple
+    color: str = "white"
+    stroke_width: int = 0
+    chars_per_line: int = None
+    box_height: int = None
+    rotation: float = 0
+    typing_speed: float = None
+    typing_hold: float = 0
+    start: float = 0
+    end: float = None
+
+    @property
+    def centered(self):
+        return self.position[0] == "center" or self.box_height is not None
+
+    def raw_text(self, values):
+        return self.text.format(**values)
+
+    def render_text(self, values):
+        """填入文字并按每行字数换行"""
+        return wrap_text(self.raw_text(values), self.chars_per_line)
+
+
+@dataclass(frozen=True)
+class RenderPlan:
+    """编译后的版式，按模板缓存并在请求之间共享（不可修改）"""
+
+    name: str
+    digest: str  # 版式文件内容哈希，参与渲染缓存键
+    width: int
+    height: int
+    layers: tuple
+    encoder_profile: str = None  # 模板默认的编码配置，请求可以覆盖
+
+    def text_layers(self):
+        return [layer for layer in self.layers if isinstance(layer, TextLayer)]
+
+    def image_layers(self):
+        return [layer for layer in self.layers if isinstance(layer, ImageLayer)]
+
+    def output_duration(self, params, template_duration):
+        """输出视频时长：模板时长和各打字机文字所需时长中的最大值"""
+        values = slot_values(params)
+        duration = template_duration
+        for layer in self.text_layers():
+            if layer.typing_speed:
+                typing = len(layer.raw_text(values)) * layer.typing_speed + layer.typing_hold
+                duration = max(duration, typing)
+        return duration
+
+    def warm_up_images(self):
+        """预热用的 (图片路径, 尺寸) 列表（随文字变化的宽度取最小宽度）"""
+        return [(layer.path, layer.size) for layer in self.image_layers()]
+
+    def font_sizes(self):
+        return sorted({layer.font_size for layer in self.text_layers()})
+
+    def scaled_size(self, factor):
+        """按比例缩小后的画布尺寸 (宽, 高)，H.264（yuv420p）要求宽高为偶数"""
+        return (
+            max(2, int(self.width * factor) // 2 * 2),
+            max(2, int(self.height * factor) // 2 * 2),
+        )
+
+    def scaled(self, factor, image_size):
+        """按比例缩小画布和全部图层的渲染计划（用于低分辨率预览）
+
+        Args:
+            factor: 缩放比例
+            image_size: 返回图片原始尺寸 (宽, 高) 的函数，用于没有指定 size 的图片
+        """
+
+        def scale(value):
+            # 百分比坐标和 "center" 不随画布变化
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return value
+            return int(round(value * factor))
+
+        layers = []
+        for layer in self.layers:
+            position = tuple(scale(v) for v in layer.position)
+            if isinstance(layer, ImageLayer):
+                size = layer.size if layer.size is not None else image_size(layer.path)
+                layers.append(
+                    replace(
+                        layer,
+                        position=position,
+                        size=(max(1, scale(size[0])), scale(size[1])),
+                        fit_padding=scale(layer.fit_padding),
+                    )
+                )
+            else:
+                layers.append(
+                    replace(
+                        layer,
+                        position=position,
+                        font_size=max(1, scale(layer.font_size)),
+                        stroke_width=max(
+                            1 if layer.stroke_width else 0, scale(layer.stroke_width)
+                        ),
+                        box_height=scale(layer.box_height),
+                    )
+                )
+        width, height = self.scaled_size(factor)
+        return replace(self, width=width, height=height, layers=tuple(layers))
+
+
+def _position(raw, where):
+    if not isinstance(raw, (list, tuple)) or len(raw) != 2:
+        raise ValueError(f"{where}: position 必须是 [x, y]")
+    # 坐标可以是像素、百分比字符串（如 "50%"），x还可以是 "center"
+    for value in raw:
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"{where}: position 坐标无效: {value}")
+    return tuple(raw)
+
+
+def _timing(raw, where):
+    start = raw.get("start", 0)
+    end = raw.get("end")
+    if end is not None and end <= start:
+        raise ValueError(f"{where}: end 必须大于 start")
+    return start, end
+
+
+def _compile_image(raw, where):
+    if "path" not in raw:
+        raise ValueError(f"{where}: 缺少 path")
+    size = raw.get("size")
+    if size is not None:
+        if not isinstance(size, (list, tuple)) or len(size) != 2 or size[0] is None:
+            raise ValueError(f"{where}: size 必须是 [宽, 高] 或 [宽, null]")
+        size = tuple(size)
+    fit_text = raw.get("fit_text")
+    if fit_text and size is None:
+        raise ValueError(f"{where}: 使用 fit_text 时需要在 size 中指定最小宽度")
+    start, end = _timing(raw, where)
+    return ImageLayer(
+        name=raw["name"],
+        path=raw["path"],
+        position=_position(raw.get("position"), where),
+        size=size,
+        fit_text=fit_text,
+        fit_padding=raw.get("fit_padding", 0),
+        start=start,
+        end=end,
+    )
+
+
+def _compile_text(raw, where):
+    for key in ("text", "font_size"):
+        if key not in raw:
+            raise ValueError(f"{where}: 缺少 {key}")
+    known = set(TEXT_SLOTS) | {f"{name}_length" for name in TEXT_SLOTS}
+    slots = set()
+    try:
+        for _, slot, _, _ in string.Formatter().parse(raw["text"]):
+            if slot is not None:
+                slots.add(slot)
+    except ValueError as e:
+        raise ValueError(f"{where}: text 格式错误: {str(e)}")
+    unknown = slots - known
+    if unknown:
+        raise ValueError(f"{where}: 未知的文字字段: {', '.join(sorted(unknown))}")
+    typewriter = raw.get("typewriter") or {}
+    start, end = _timing(raw, where)
+    return TextLayer(
+        name=raw["name"],
+        text=raw["text"],
+        font_size=raw["font_size"],
+        position=_position(raw.get("position"), where),
+        color=raw.get("color", "white"),
+        stroke_width=raw.get("stroke_width", 0),
+        chars_per_line=raw.get("chars_per_line"),
+        box_height=raw.get("box_height"),
+        rotation=raw.get("rotation", 0),
+        typing_speed=typewriter.get("speed"),
+        typing_hold=typewriter.get("hold", 0),
+        start=start,
+        end=end,
+    )
+
+
+def compile_layout(spec, name="", digest=""):
+    """把版式描述（dict）编译为RenderPlan，描述无效时抛出ValueError"""
+    canvas = spec.get("canvas", (1080, 1920))
+    if (
+        not isinstance(canvas, (list, tuple))
+        or len(canvas) != 2
+        or not all(isinstance(v, int) and v > 0 and v % 2 == 0 for v in canvas)
+    ):
+        # H.264（yuv420p）要求宽高为偶数
+        raise ValueError(f"版式 {name}: canvas 必须是 [宽, 高]，且宽高为正偶数")
+    width, height = canvas
+    layers = []
+    names = set()
+    for i, raw in enumerate(spec.get("layers", [])):
+        where = f"版式 {name} 第{i + 1}层"
+        if not raw.get("name"):
+            raise ValueError(f"{where}: 缺少 name")
+        if raw["name"] in names:
+            raise ValueError(f"{where}: 图层名称重复: {raw['name']}")
+        names.add(raw["name"])
+        if raw.get("type") == "image":
+            layers.append(_compile_image(raw, where))
+        elif raw.get("type") == "text":
+            layers.append(_compile_text(raw, where))
+        else:
+            raise ValueError(f"{where}: 不支持的图层类型: {raw.get('type')}")
+
+    encoder_profile = spec.get("encoder_profile")
+    if encoder_profile is not None and encoder_profile not in ENCODER_PROFILES:
+        raise ValueError(f"版式 {name}: 不支持的编码配置: {encoder_profile}")
+
+    text_names = {layer.name for layer in layers if isinstance(layer, TextLayer)}
+    for layer in layers:
+        if isinstance(layer, ImageLayer) and layer.fit_text and layer.fit_text not in text_names:
+            raise ValueError(f"版式 {name}: 图层 {layer.name} 引用的文字图层不存在: {layer.fit_text}")
+    return RenderPlan(
+        name=name,
+        digest=digest,
+        width=width,
+        height=height,
+        layers=tuple(layers),
+        encoder_profile=encoder_profile,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_file(path, mtime_ns):
+    """编译版式文件，按路径和修改时间缓存（文件修改后自动重新编译）"""
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        spec = json.loads(data.decode("utf-8"))
+    except ValueError as e:
+        raise ValueError(f"版式文件 {path} 格式错误: {str(e)}")
+    name = os.path.splitext(os.path.basename(path))[0]
+    return compile_layout(spec, name, hashlib.sha1(data).hexdigest())
+
+
+def layout_path(template_id=None, layout_dir=None):
+    """模板对应的版式文件路径"""
+    layout_dir = layout_dir or LAYOUT_DIR
+    if template_id:
+        path = os.path.join(layout_dir, f"{os.path.basename(str(template_id))}.json")
+        if os.path.exists(path):
+            return path
+    return os.path.join(layout_dir, f"{DEFAULT_LAYOUT}.json")
+
+
+def load_plan(template_id=None, layout_dir=None):
+    """获取模板的渲染计划（每个版式文件只编译一次）"""
+    path = layout_path(template_id, layout_dir)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise ValueError(f"版式文件不存在: {path}")
+    return _compile_file(path, mtime_ns)
+
+
+def all_plans(layout_dir=None):
+    """目录下的全部版式（用于工作进程预热）"""
+    layout_dir = layout_dir or LAYOUT_DIR
+    return [
+        load_plan(os.path.splitext(f)[0], layout_dir)
+        for f in sorted(os.listdir(layout_dir))
+        if f.endswith(".json")
+    ]
@@ -0,0 +1,175 @@
+import numpy as np
+from moviepy.editor import ImageClip
+
+
+class StaticLayer:
+    """预合成的静态叠加层，像素以预乘Alpha的RGBA（uint8）保存"""
+
+    def __init__(self, rgb, alpha, position, start, end):
+        self.rgb = rgb  # 预乘后的RGB，形状(h, w, 3)
+        self.alpha = alpha  # Alpha通道，形状(h, w)
+        self.position = position
+        self.start = start
+        self.end = end
+
+    @property
+    def size(self):
+        return (self.alpha.shape[1], self.alpha.shape[0])
+
+    def straight_rgb(self):
+        """还原为非预乘的RGB（uint8）"""
+        alpha = self.alpha.astype(np.float32)[..., None]
+        rgb = self.rgb.astype(np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            straight = np.where(alpha > 0, rgb * 255.0 / alpha, 0)
+        return np.clip(straight + 0.5, 0, 255).astype(np.uint8)
+
+
+def clip_frame_rgba(clip, t=0):
+    """读取clip在clip内时间t的RGB（float）和Alpha（0-1）"""
+    rgb = clip.get_frame(t).astype(np.float32)
+    if rgb.ndim == 2:
+        rgb = np.repeat(rgb[..., None], 3, axis=2)
+    if clip.mask is not None:
+        alpha = clip.mask.get_frame(t).astype(np.float32)
+    else:
+        alpha = np.ones(rgb.shape[:2], dtype=np.float32)
+    if rgb.shape[:2] != alpha.shape:
+        # 与MoviePy的blit保持一致：图片尺寸以遮罩为准
+        filled = np.zeros(alpha.shape + (3,), dtype=np.float32)
+        h = min(rgb.shape[0], alpha.shape[0])
+        w = min(rgb.shape[1], alpha.shape[1])
+        filled[:h, :w] = rgb[:h, :w]
+        rgb = filled
+    return rgb, alpha
+
+
+def static_pixels(clip):
+    """读取静态图片叠加层的像素和位置，无法合并的clip返回None"""
+    if not isinstance(clip, ImageClip) or clip.end is None:
+        return None
+    if getattr(clip, "relative_pos", False):
+        return None
+    pos = clip.pos(0)
+    if isinstance(pos, str) or any(isinstance(v, str) for v in pos):
+        return None
+
+    rgb, alpha = clip_frame_rgba(clip)
+    x, y = int(pos[0]), int(pos[1])
+    h, w = alpha.shape
+    return {"rgb": rgb, "alpha": alpha, "bbox": (x, y, x + w, y + h)}
+
+
+def _clip_bbox(clip):
+    """估算不可合并clip的覆盖区域，无法确定时返回None（视为覆盖全画面）"""
+    try:
+        pos = clip.pos(0)
+        x, y = int(pos[0]), int(pos[1])
+        w, h = clip.size
+        return (x, y, x + w, y + h)
+    except Exception:
+        return None
+
+
+def _overlaps(a, b):
+    if a is None or b is None:
+        return True
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class _Group:
+    def __init__(self, key, clip, pixels):
+        self.key = key
+        self.clips = [clip]
+        self.members = [pixels]
+        self.bbox = pixels["bbox"]
+
+    def add(self, clip, pixels):
+        self.clips.append(clip)
+        self.members.append(pixels)
+        b = pixels["bbox"]
+        self.bbox = (
+            min(self.bbox[0], b[0]),
+            min(self.bbox[1], b[1]),
+            max(self.bbox[2], b[2]),
+            max(self.bbox[3], b[3]),
+        )
+
+    def flatten(self, frame_size):
+        """按叠放顺序将组内所有图层合成为一个预乘Alpha图层"""
+        fw, fh = frame_size
+        x0, y0 = max(0, self.bbox[0]), max(0, self.bbox[1])
+        x1, y1 = min(fw, self.bbox[2]), min(fh, self.bbox[3])
+        if x1 <= x0 or y1 <= y0:
+            return None
+
+        rgb = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.float32)
+        alpha = np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+        for m in self.members:
+            bx0, by0, bx1, by1 = m["bbox"]
+            # 与合成区域求交，超出画面的部分直接裁掉
+            cx0, cy0 = max(bx0, x0), max(by0, y0)
+            cx1, cy1 = min(bx1, x1), min(by1, y1)
+            if cx1 <= cx0 or cy1 <= cy0:
+                continue
+            src_a = m["alpha"][cy0 - by0 : cy1 - by0, cx0 - bx0 : cx1 - bx0]
+            src_rgb = m["rgb"][cy0 - by0 : cy1 - by0, cx0 - bx0 : cx1 - bx0]
+            dst = (slice(cy0 - y0, cy1 - y0), slice(cx0 - x0, cx1 - x0))
+            # 预乘Alpha的over运算：out = src * a + dst * (1 - a)
+            inv = 1.0 - src_a
+            rgb[dst] = src_rgb * src_a[..., None] + rgb[dst] * inv[..., None]
+            alpha[dst] = src_a + alpha[dst] * inv
+
+        start, end = self.key
+        return StaticLayer(
+            np.clip(rgb + 0.5, 0, 255).astype(np.uint8),
+            np.clip(alpha * 255.0 + 0.5, 0, 255).astype(np.uint8),
+            (x0, y0),
+            start,
+            end,
+        )
+
+
+def flatten_overlays(overlays, frame_size):
+    """将起止时间相同的静态叠加层合并为一个图层，减少每帧的混合次数
+
+    只有在两者之间没有其他图层与其在画面上重叠时，才会把后面的clip
+    并入前面的同时段分组，从而保证合并前后的叠放效果一致。
+    返回的列表中，合并后的分组为StaticLayer，其余保持原clip。
+    """
+    items = []
+    for clip in overlays:
+        pixels = static_pixels(clip)
+        if pixels is None:
+            items.append(clip)
+            continue
+
+        key = (clip.start, clip.end)
+        target = None
+        for item in reversed(items):
+            if isinstance(item, _Group):
+                if item.key == key:
+                    target = item
+                    break
+                if _overlaps(item.bbox, pixels["bbox"]):
+                    break
+            elif _overlaps(_clip_bbox(item), pixels["bbox"]):
+                break
+
+        if target is not None:
+            target.add(clip, pixels)
+        else:
+            items.append(_Group(key, clip, pixels))
+
+    layers = []
+    for item in items:
+        if not isinstance(item, _Group):
+            layers.append(item)
+        elif len(item.clips) == 1:
+            # 单独的图层无需重新合成
+            layers.append(item.clips[0])
+        else:
+            layer = item.flatten(frame_size)
+            if layer is not None:
+                layers.append(layer)
+    return layers
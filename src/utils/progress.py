@@ -0,0 +1,138 @@
+import os
+import time
+import queue
+import threading
+
+import proglog
+
+# 两次进度上报的最小间隔（秒）
+PROGRESS_INTERVAL = float(os.environ.get("PROGRESS_INTERVAL", 0.5))
+
+# 以下状态只在渲染工作进程中使用，由 install 和 begin 设置
+_channel = None  # 发往Web进程的进度队列
+_job_id = None
+_state = {}
+_last_sent = 0.0
+_frames_base = None  # 当前视频第一次上报帧数时的 (时间, 帧数)，用于计算写入速度
+
+
+def install(channel):
+    """在渲染工作进程中设置进度队列（进程池的初始化函数中调用）"""
+    global _channel
+    _channel = channel
+
+
+def _send(force=False):
+    global _last_sent
+    now = time.monotonic()
+    if not force and now - _last_sent < PROGRESS_INTERVAL:
+        return
+    _last_sent = now
+    try:
+        _channel.put_nowait((_job_id, dict(_state)))
+    except queue.Full:
+        # Web进程来不及读取时丢弃本次进度，不阻塞渲染
+        pass
+
+
+def begin(job_id):
+    """开始上报任务的进度"""
+    global _job_id, _state, _frames_base
+    _job_id = job_id
+    _state = {"stage": "running"}
+    _frames_base = None
+    if _channel is not None:
+        _send(force=True)
+
+
+def end():
+    global _job_id
+    _job_id = None
+
+
+def stage(name):
+    """记录当前渲染阶段（由 StageTimer 在进入各阶段时调用，按间隔节流）"""
+    if _job_id is None or _channel is None:
+        return
+    _state["stage"] = name
+    _send()
+
+
+def frames(done, total):
+    """记录已写入的帧数，并根据写入速度估算剩余时间"""
+    global _frames_base
+    if _job_id is None or _channel is None:
+        return
+    now = time.monotonic()
+    if _frames_base is None or done < _frames_base[1]:
+        # 第一次上报，或批量渲染开始写入下一个视频
+        _frames_base = (now, done)
+    started, base = _frames_base
+    eta = None
+    if total and done > base:
+        eta = round((now - started) / (done - base) * max(0, total - done), 1)
+    _state["frames"] = done
+    _state["total_frames"] = total
+    _state["eta"] = eta
+    _send()
+
+
+def run_job(job_id, fn, *args):
+    """在工作进程中执行任务，期间上报该任务的进度"""
+    begin(job_id)
+    try:
+        return fn(*args)
+    finally:
+        end()
+
+
+class SegmentProgress:
+    """分段并行渲染时汇总各分段的帧数，作为整个任务的进度上报（在渲染工作进程中使用）
+
+    分段进程以 install(channel) 初始化，并以分段序号作为任务ID调用 run_job，
+    其进度发往本进程的 channel，由后台线程按分段累加已写入的帧数后上报。
+    """
+
+    def __init__(self, context, total_frames):
+        """
+        Args:
+            context: 启动分段进程使用的multiprocessing上下文
+            total_frames: 全部分段的总帧数
+        """
+        self.channel = context.Queue()
+        self.total_frames = total_frames
+        self._frames = {}  # 分段序号 -> 已写入帧数
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+
+    def _collect(self):
+        while True:
+            item = self.channel.get()
+            if item is None:
+                return
+            index, state = item
+            if "frames" not in state:
+                continue
+            self._frames[index] = state["frames"]
+            # 当前进程只在等待分段，阶段以分段进程的为准
+            _state["stage"] = state["stage"]
+            # 各分段按自己的时长取整帧数，合计可能略多于总帧数
+            frames(min(sum(self._frames.values()), self.total_frames), self.total_frames)
+
+    def close(self):
+        self.channel.put(None)
+        self._thread.join()
+        self.channel.close()
+
+
+class FrameProgressLogger(proglog.ProgressBarLogger):
+    """MoviePy写入视频时使用的logger，把写入的帧数上报为任务进度（不输出进度条）"""
+
+    def __init__(self):
+        super().__init__(min_time_interval=PROGRESS_INTERVAL)
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar == "t" and attr == "index":
+            # MoviePy按时长取整的帧数可能比进度条的总帧数多一帧
+            total = self.bars[bar]["total"]
+            frames(min(value + 1, total), total)
@@ -0,0 +1,93 @@
+import os
+import math
+import subprocess
+
+from moviepy.config import get_setting
+
+from .logger import VideoLogger
+from .encoder_profiles import host_cpus
+
+logger = VideoLogger()
+
+# 分段并行渲染的最短分段时长（秒），过短的分段启动开销大于收益
+MIN_SEGMENT_SECONDS = 2
+
+
+def segment_workers():
+    """分段渲染使用的进程数，由环境变量 SEGMENT_WORKERS 指定
+
+    分段进程由渲染进程池中的进程启动，默认把可用CPU核数（考虑CPU亲和性和
+    容器配额，见 encoder_profiles.host_cpus）平均分给各渲染进程
+    （RENDER_WORKERS，默认等于可用核数），避免多个分段任务同时运行时
+    进程数达到CPU核数的平方。请求分段时至少分为2段（只有1个可用核时除外），
+    否则默认配置下分段渲染不会带来任何加速；分段任务的内存由接纳控制按
+    （分段数 + 1）个进程预留。
+    """
+    if os.environ.get("SEGMENT_WORKERS"):
+        return max(1, int(os.environ["SEGMENT_WORKERS"]))
+    cpus = host_cpus()
+    if cpus < 2:
+        return 1
+    render_workers = int(os.environ.get("RENDER_WORKERS", cpus))
+    return max(2, cpus // max(1, render_workers))
+
+
+def split_timeline(duration, parts):
+    """把[0, duration)按整秒边界切分为最多parts段
+
+    分段边界落在整秒上，与每秒一个关键帧（-g 24）的编码参数对齐，
+    拼接时不需要重新编码。
+
+    Returns:
+        list: [(start, end), ...]
+    """
+    seconds = math.ceil(duration)
+    parts = max(1, min(parts, seconds // MIN_SEGMENT_SECONDS or 1))
+    length = math.ceil(seconds / parts)
+    segments = []
+    start = 0
+    while start < duration:
+        end = min(start + length, duration)
+        segments.append((start, end))
+        start = end
+    return segments
+
+
+def concat_segments(segment_paths, audio_path, output_path):
+    """用concat demuxer无损拼接视频分段，并混入单独编码的音轨"""
+    list_path = f"{output_path}.segments.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+
+    cmd = [
+        get_setting("FFMPEG_BINARY"),
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        list_path,
+        "-i",
+        audio_path,
+        "-map",
+        "0:v",
+        "-map",
+        "1:a",
+        "-c",
+        "copy",
+        "-shortest",
+        "-movflags",
+        "+faststart",
+        output_path,
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        raise RuntimeError(f"视频分段合并失败: {result.stderr.strip()[-500:]}")
+    logger.info(f"已合并 {len(segment_paths)} 个视频分段: {output_path}")
@@ -0,0 +1,72 @@
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+from . import progress
+
+
+class StageTimer:
+    """按阶段累计耗时和计数
+
+    阶段可以嵌套，外层阶段只记录自身耗时（不含内层阶段），
+    因此各阶段耗时之和等于总耗时（分段并行渲染时合并了各分段进程的耗时，
+    各阶段之和为所有进程的耗时之和）。
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._stack = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """统计with块内的耗时，计入name阶段"""
+        progress.stage(name)
+        start = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._stack.pop()
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed - nested
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def count(self, name, value=1):
+        """累加计数（帧数、叠加层数量、写入字节数等）"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, snapshot):
+        """累加另一个计时器的 snapshot()（汇总批量渲染各视频、分段渲染各分段的统计）"""
+        with self._lock:
+            for name, seconds in snapshot["stages"].items():
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """返回可序列化的耗时和计数"""
+        with self._lock:
+            return {
+                "stages": {k: round(v, 6) for k, v in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+
+def timed(name):
+    """方法装饰器：把方法的耗时计入 self.timer 的name阶段"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.timer.stage(name):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,141 @@
+import os
+import fcntl
+import hashlib
+import subprocess
+import threading
+
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+from .logger import VideoLogger
+
+logger = VideoLogger()
+
+# 预处理后的模板视频存放目录
+TEMPLATE_CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR", "cache/templates")
+
+# 文件哈希缓存：(路径, 大小, 修改时间) -> sha1，避免每次请求都重新读取整个文件
+_hash_cache = {}
+_hash_lock = threading.Lock()
+# 视频时长缓存：文件哈希 -> 时长（秒）
+_duration_cache = {}
+
+
+def file_hash(path):
+    """计算文件内容的sha1，文件未变化时直接返回缓存结果"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        if key in _hash_cache:
+            return _hash_cache[key]
+
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(chunk)
+    digest = sha1.hexdigest()
+
+    with _hash_lock:
+        _hash_cache[key] = digest
+    return digest
+
+
+def video_duration(path):
+    """读取视频时长（秒），按文件内容缓存，不需要打开解码器"""
+    digest = file_hash(path)
+    with _hash_lock:
+        if digest in _duration_cache:
+            return _duration_cache[digest]
+    duration = ffmpeg_parse_infos(path)["duration"]
+    with _hash_lock:
+        _duration_cache[digest] = duration
+    return duration
+
+
+def prepared_template_path(video_path, width=1080, height=1920, fps=24):
+    """预处理模板的缓存路径，以源文件内容哈希和输出参数为键"""
+    digest = file_hash(video_path)
+    return os.path.join(TEMPLATE_CACHE_DIR, f"{digest}_{width}x{height}_{fps}.mp4")
+
+
+def prepare_template(video_path, width=1080, height=1920, fps=24):
+    """把模板视频一次性转码为渲染使用的分辨率、帧率和像素格式
+
+    返回预处理后的视频路径；转码失败时记录日志并返回原始路径，
+    由调用方按原来的方式逐帧缩放。
+    """
+    target = prepared_template_path(video_path, width, height, fps)
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    # 多个工作进程同时预处理同一个模板时，只让一个进程执行转码
+    with open(target + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            if os.path.exists(target):
+                return target
+
+            tmp_path = f"{target}.{os.getpid()}.tmp.mp4"
+            cmd = [
+                get_setting("FFMPEG_BINARY"),
+                "-y",
+                "-loglevel",
+                "error",
+                "-i",
+                video_path,
+                "-an",
+                "-vf",
+                f"scale={width}:{height},fps={fps},setsar=1",
+                "-pix_fmt",
+                "yuv420p",
+                "-c:v",
+                "libx264",
+                "-preset",
+                "veryfast",
+                "-crf",
+                "16",
+                "-g",
+                str(fps),
+                "-movflags",
+                "+faststart",
+                tmp_path,
+            ]
+            logger.info(f"预处理模板视频: {video_path} -> {target}")
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                logger.warning(
+                    f"模板视频预处理失败，使用原始文件: {result.stderr.strip()[-300:]}"
+                )
+                return video_path
+            os.replace(tmp_path, target)
+            return target
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def prepare_all_templates(input_dir="asset/video", sizes=((1080, 1920),)):
+    """预处理目录下的所有模板视频
+
+    Args:
+        sizes: 需要预处理的分辨率 [(宽, 高), ...]
+    Returns:
+        dict: 模板路径 -> 各分辨率预处理后的路径列表
+    """
+    prepared = {}
+    for f in sorted(os.listdir(input_dir)):
+        if f.lower().endswith((".mp4", ".avi", ".mov")):
+            path = os.path.join(input_dir, f)
+            prepared[path] = [prepare_template(path, width, height) for width, height in sizes]
+    return prepared
+
+
+if __name__ == "__main__":
+    from .layout_plan import all_plans
+
+    plan_sizes = sorted({(plan.width, plan.height) for plan in all_plans()})
+    for source, targets in prepare_all_templates(sizes=plan_sizes).items():
+        for target in targets:
+            print(f"{source} -> {target}")
@@ -0,0 +1,85 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from PIL import ImageFont
+
+# 按优先级尝试的中文字体路径
+FONT_PATHS = [
+    "assets/font/PingFang.ttc",  # 项目目录下的字体文件
+    "/System/Library/Fonts/PingFang.ttc",  # Mac
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",  # Linux
+    "C:/Windows/Fonts/simhei.ttf",  # Windows
+]
+
+
+@lru_cache(maxsize=None)
+def resolve_font_path():
+    """查找第一个可用的字体文件，进程内只查找一次"""
+    for path in FONT_PATHS:
+        try:
+            ImageFont.truetype(path, 12)
+            return path
+        except Exception:
+            continue
+    raise RuntimeError("字体加载失败: No valid font found，请确认已安装中文字体")
+
+
+@lru_cache(maxsize=64)
+def _truetype(path, size):
+    return ImageFont.truetype(path, size)
+
+
+def get_font(size):
+    """获取指定字号的字体对象，按 (字体路径, 字号) 缓存"""
+    return _truetype(resolve_font_path(), size)
+
+
+class TextImageCache:
+    """文字图片的LRU缓存，按占用内存上限淘汰最久未使用的图片
+
+    缓存的PIL图片在多次调用间共享，调用方不得原地修改。
+    """
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("TEXT_CACHE_MB", 64)) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _image_bytes(img):
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, key):
+        with self._lock:
+            img = self._items.get(key)
+            if img is not None:
+                self._items.move_to_end(key)
+            return img
+
+    def put(self, key, img):
+        size = self._image_bytes(img)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= self._image_bytes(old)
+            self._items[key] = img
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= self._image_bytes(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+
+# 进程内共享的文字图片缓存
+text_image_cache = TextImageCache()
@@ -0,0 +1,66 @@
+from bisect import bisect_right
+
+import numpy as np
+from PIL import Image
+from moviepy.editor import VideoClip
+
+
+class TypewriterClip(VideoClip):
+    """打字机效果文字clip
+
+    整段文字只栅格化为一张图片，boxes记录每个字符在图片上的显示区域
+    （换行符为None）。第i个字符在clip内时间 i * typing_speed 时出现，
+    每帧只需根据已显示的字符数返回对应的遮罩，与文字长度无关。
+    """
+
+    def __init__(self, image, boxes, typing_speed, duration=None, rotation_angle=0):
+        rgba = np.array(image.convert("RGBA"))
+        self.rotation_angle = rotation_angle
+        self.rgb = self._rotate(np.ascontiguousarray(rgba[..., :3]))
+        # alpha和boxes均为旋转前的坐标，遮罩计算完成后再整体旋转
+        self.alpha = rgba[..., 3].astype(np.float64) / 255.0
+        self.boxes = list(boxes)
+        self.typing_speed = typing_speed
+        # 第i个字符开始显示的clip内时间
+        self.step_times = [i * typing_speed for i in range(len(self.boxes))]
+
+        self._revealed = np.zeros(self.alpha.shape, dtype=bool)
+        self._revealed_count = 0
+        self._mask_cache = (0, self._rotate(np.zeros_like(self.alpha)))
+
+        VideoClip.__init__(self, make_frame=lambda t: self.rgb, duration=duration)
+        mask = VideoClip(make_frame=self._make_mask, ismask=True, duration=duration)
+        self.mask = mask
+
+    def _rotate(self, arr):
+        """按旋转角度旋转图片（与MoviePy的rotate效果一致）"""
+        if not self.rotation_angle:
+            return arr
+        img = Image.fromarray(arr)
+        img = img.rotate(self.rotation_angle, resample=Image.BILINEAR, expand=True)
+        return np.array(img)
+
+    def visible_count(self, t):
+        """clip内时间t时已显示的字符数"""
+        return bisect_right(self.step_times, t)
+
+    def _reveal(self, count):
+        """更新已显示区域，时间回退时从头重新计算"""
+        if count < self._revealed_count:
+            self._revealed[:] = False
+            self._revealed_count = 0
+        for box in self.boxes[self._revealed_count : count]:
+            if box is not None:
+                x0, y0, x1, y1 = box
+                self._revealed[y0:y1, x0:x1] = True
+        self._revealed_count = count
+
+    def _make_mask(self, t):
+        count = self.visible_count(t)
+        cached_count, cached_mask = self._mask_cache
+        if count == cached_count:
+            return cached_mask
+        self._reveal(count)
+        mask = self._rotate(np.where(self._revealed, self.alpha, 0.0))
+        self._mask_cache = (count, mask)
+        return mask
@@ -1,72 +1,151 @@
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from PIL import Image, ImageDraw, ImageFilter
 import os
-import random
+import hashlib
+import tempfile
 from moviepy.editor import (
     VideoFileClip,
     ImageClip,
     TextClip,
-    CompositeVideoClip,
-    AudioFileClip,
-    concatenate_audioclips,
+    VideoClip,
 )
 
 from .logger import VideoLogger
+from .asset_index import AssetIndex
+from .text_cache import get_font, text_image_cache
+from .ffmpeg_renderer import FFmpegRenderer, render_batch
+from .overlay_layer import flatten_overlays
+from .compositor import Compositor
+from .frame_cache import LoopFrameCache, loop_cache_bytes
+from .template_cache import prepare_template
+from .audio_cache import audio_track, prepare_audio_bed
+from .asset_store import asset_store
+from .typewriter_clip import TypewriterClip
+from .stage_timer import StageTimer, timed
+from .encoder_profiles import moviepy_options, profile_name
+from .progress import FrameProgressLogger
 
 
 class VideoEditor:
     logger = VideoLogger()
+    RENDER_BACKENDS = ("moviepy", "ffmpeg")
+    # 预览方式：still为单张画面，clip为低分辨率低帧率的短视频
+    PREVIEW_KINDS = ("still", "clip")
+    PREVIEW_SCALE = 1 / 3
+    PREVIEW_FPS = 8
+    # 预览短视频最多截取的时长（秒）
+    PREVIEW_CLIP_SECONDS = 5
+
+    # 默认输出分辨率（宽, 高），版式可以通过 canvas 指定其他分辨率
+    FRAME_SIZE = (1080, 1920)
+
+    VIDEO_FORMATS = (".mp4", ".avi", ".mov")
+    AUDIO_FORMATS = (".mp3", ".wav")
 
     @staticmethod
-    def get_random_video(input_dir):
-        video_files = [
-            f
-            for f in os.listdir(input_dir)
-            if f.lower().endswith((".mp4", ".avi", ".mov"))
-        ]
-        if not video_files:
-            VideoEditor.logger.error(f"在{input_dir}目录中没有找到视频文件")
-            raise ValueError(f"在{input_dir}目录中没有找到视频文件")
-        VideoEditor.logger.info(f"从{input_dir}中随机选择视频文件")
-        return os.path.join(input_dir, random.choice(video_files))
+    def select_video(template_id, input_dir="asset/video"):
+        """根据模板ID（视频文件名，不含扩展名）选择模板视频"""
+        path = AssetIndex.for_directory(input_dir, VideoEditor.VIDEO_FORMATS).path_for(
+            template_id
+        )
+        if path is None:
+            VideoEditor.logger.error(f"在{input_dir}目录中没有找到视频模板: {template_id}")
+            raise ValueError(f"未找到视频模板: {template_id}")
+        return path
 
     @staticmethod
-    def get_random_audio(input_dir):
-        audio_files = [
-            f for f in os.listdir(input_dir) if f.lower().endswith((".mp3", ".wav"))
-        ]
+    def select_audio(audio_id=None, seed=None, input_dir="asset/audio"):
+        """确定性地选择背景音乐
+
+        指定audio_id时按文件名选择；否则根据seed的哈希在排序后的音频列表中选取，
+        相同的seed总是得到相同的音乐。
+        """
+        index = AssetIndex.for_directory(input_dir, VideoEditor.AUDIO_FORMATS)
+        if audio_id:
+            path = index.path_for(audio_id)
+            if path is None:
+                raise ValueError(f"未找到背景音乐: {audio_id}")
+            return path
+
+        audio_files = index.files()
         if not audio_files:
             raise ValueError(f"在{input_dir}目录中没有找到音频文件")
-        return os.path.join(input_dir, random.choice(audio_files))
+        digest = hashlib.sha1(str(seed).encode("utf-8")).hexdigest()
+        return os.path.join(input_dir, audio_files[int(digest[:8], 16) % len(audio_files)])
 
-    def __init__(self, video_path):
+    @staticmethod
+    def open_template(video_path, width=1080, height=1920):
+        """打开模板视频（使用预先转码为目标分辨率和帧率的版本，避免逐帧缩放）"""
+        video = VideoFileClip(prepare_template(video_path, width, height), audio=False)
+        if video.duration is None:
+            raise ValueError("无法获取视频时长，视频文件可能已损坏")
+        if tuple(video.size) != (width, height):
+            # 预处理失败时才需要调整视频大小以适应目标分辨率
+            video = video.resize((width, height))
+        return video
+
+    def __init__(
+        self, video_path, audio_path, template=None, encoder_profile=None, size=None
+    ):
+        """
+        Args:
+            audio_path: 背景音乐路径，由调用方通过 select_audio 确定性选择
+                （单个渲染默认以店名为seed，批量渲染以模板ID为seed）
+            template: 已通过 open_template 打开的模板（批量渲染时共享，由调用方关闭，
+                分辨率需与 size 一致）
+            encoder_profile: 编码配置名称（见 encoder_profiles.ENCODER_PROFILES）
+            size: 输出分辨率 (宽, 高)，默认为 FRAME_SIZE
+        """
+        # 各阶段耗时和计数，渲染结束后由调用方上报
+        self.timer = StageTimer()
+        self.encoder_profile = profile_name(encoder_profile)
         if not os.path.exists(video_path):
             raise ValueError(f"视频文件不存在: {video_path}")
 
-        valid_formats = (".mp4", ".avi", ".mov")
+        valid_formats = self.VIDEO_FORMATS
         if not video_path.lower().endswith(valid_formats):
             raise ValueError(
                 f"不支持的视频格式。支持的格式: {', '.join(valid_formats)}"
             )
 
         try:
-            self.video = VideoFileClip(video_path, audio=False)
-            if self.video.duration is None:
-                raise ValueError("无法获取视频时长，视频文件可能已损坏")
-            # 设置固定的输出分辨率
-            self.width = 1080
-            self.height = 1920
-            # 调整视频大小以适应目标分辨率
-            self.video = self.video.resize((self.width, self.height))
-
-            # 加载随机背景音乐
-            audio_path = self.get_random_audio("asset/audio")
-            self.audio = AudioFileClip(audio_path)
+            # 输出分辨率，模板视频预先转码为该分辨率
+            self.width, self.height = size or self.FRAME_SIZE
+            with self.timer.stage("init"):
+                self.video_path = prepare_template(video_path, self.width, self.height)
+                self._owns_video = template is None
+                self.video = template or self.open_template(
+                    video_path, self.width, self.height
+                )
+
+            with self.timer.stage("asset_load"):
+                # 背景音乐只预编码一次，渲染时直接复制AAC数据
+                self.audio_path = audio_path
+                self.audio_bed = prepare_audio_bed(self.audio_path)
         except Exception as e:
             raise ValueError(f"无法加载视频或音频文件: {str(e)}")
 
         self.overlays = []
+        # 模板循环播放时缓存已解码的画面（见 loop_video）
+        self.frame_cache = None
+
+    def _loop(self, video, duration):
+        """把视频循环到指定时长，第一次循环时为模板加上画面缓存
+
+        整段模板画面超过 FRAME_CACHE_MB 时不缓存，每一遍重新解码。
+        """
+        if self.frame_cache is None:
+            cache_bytes = loop_cache_bytes(video.duration, video.fps, (self.width, self.height))
+            if cache_bytes:
+                self.frame_cache = LoopFrameCache(video.fps, cache_bytes)
+                video = self.frame_cache.wrap(video)
+        loop_count = int(duration / video.duration) + 1
+        return video.loop(n=loop_count).subclip(0, duration)
+
+    def loop_video(self, duration):
+        """循环模板视频以延长到指定时长，循环部分的画面不再重新解码"""
+        self.video = self._loop(self.video, duration)
 
     def _calculate_position(self, position, text_width=0, text_height=0):
         x, y = position
@@ -79,37 +158,19 @@ class VideoEditor:
         y = max(0, min(y, self.height - text_height))
         return (x, y)
 
-    def create_text_image(
-        self, text, font_size=30, color="white", stroke_color="black", stroke_width=2
-    ):
-        """创建高清晰度的中文文本图片（支持旋转抗锯齿）"""
+    def _load_font(self, font_size_scaled):
+        """加载中文字体（字体路径只查找一次，字体对象按字号缓存）"""
+        return get_font(font_size_scaled)
+
+    def _text_layout(self, text, font_size, stroke_width):
+        """计算高清文字图片的画布尺寸和绘制位置"""
         # 高清渲染参数
         scale_factor = 3.0  # 提高分辨率渲染倍数
         font_size_scaled = int(font_size * scale_factor)
         stroke_width_scaled = max(
             1, int(stroke_width * (scale_factor * 0.25))
         )  # 进一步降低描边宽度的缩放比例
-
-        # 中文字体加载（优先使用自定义字体文件）
-        try:
-            # 尝试加载多个平台的系统字体
-            font_paths = [
-                "assets/font/PingFang.ttc",  # 项目目录下的字体文件
-                "/System/Library/Fonts/PingFang.ttc",  # Mac
-                "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",  # Linux
-                "C:/Windows/Fonts/simhei.ttf",  # Windows
-            ]
-
-            for path in font_paths:
-                try:
-                    font = ImageFont.truetype(path, font_size_scaled)
-                    break
-                except:
-                    continue
-            else:
-                raise IOError("No valid font found")
-        except Exception as e:
-            raise RuntimeError(f"字体加载失败: {str(e)}，请确认已安装中文字体")
+        font = self._load_font(font_size_scaled)
 
         # 计算文本尺寸（考虑描边和边距）
         temp_img = Image.new("RGBA", (1, 1))
@@ -123,28 +184,60 @@ class VideoEditor:
         text_width = bbox[2] - bbox[0] + padding * 2
         text_height = bbox[3] - bbox[1] + padding * 2
 
-        # 创建高清画布
-        img = Image.new(
-            "RGBA",
-            (
+        return {
+            "font": font,
+            "draw": temp_draw,
+            "scale_factor": scale_factor,
+            "stroke_width": stroke_width_scaled,
+            # 高清画布尺寸
+            "canvas_size": (
                 text_width + stroke_width_scaled * 4,
                 text_height + stroke_width_scaled * 4,
             ),
-            (0, 0, 0, 0),
-        )
-        draw = ImageDraw.Draw(img)
+            # 文本绘制位置（居中+边距）
+            "origin": (
+                stroke_width_scaled * 2 + padding,
+                stroke_width_scaled * 2 + padding,
+            ),
+        }
 
-        # 文本绘制位置（居中+边距）
-        x = stroke_width_scaled * 2 + padding
-        y = stroke_width_scaled * 2 + padding
+    def create_text_image(
+        self, text, font_size=30, color="white", stroke_color="black", stroke_width=2
+    ):
+        """创建高清晰度的中文文本图片（支持旋转抗锯齿）
+
+        结果会被缓存并在多次调用间共享，调用方不要原地修改返回的图片。
+        """
+        cache_key = (text, font_size, color, stroke_color, stroke_width)
+        cached = text_image_cache.get(cache_key)
+        if cached is not None:
+            self.timer.count("text_cache_hits")
+            return cached
+        self.timer.count("text_cache_misses")
+
+        with self.timer.stage("text_render"):
+            img = self._rasterize_text(text, font_size, color, stroke_color, stroke_width)
+        text_image_cache.put(cache_key, img)
+
+        # 返回PIL图像对象
+        return img
+
+    def _rasterize_text(self, text, font_size, color, stroke_color, stroke_width):
+        """以高分辨率绘制文字，再下采样并锐化"""
+        layout = self._text_layout(text, font_size, stroke_width)
+        scale_factor = layout["scale_factor"]
+
+        # 创建高清画布
+        img = Image.new("RGBA", layout["canvas_size"], (0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
 
         # 使用Pillow内置描边功能（版本8.0+）
         draw.text(
-            (x, y),
+            layout["origin"],
             text,
-            font=font,
+            font=layout["font"],
             fill=color,
-            stroke_width=stroke_width_scaled,
+            stroke_width=layout["stroke_width"],
             stroke_fill=stroke_color,
         )
 
@@ -153,11 +246,55 @@ class VideoEditor:
             (int(img.width // scale_factor), int(img.height // scale_factor)),
             resample=Image.LANCZOS,
         )
-        img = img.filter(ImageFilter.SHARPEN)
-
-        # 返回PIL图像对象
-        return img
+        return img.filter(ImageFilter.SHARPEN)
+
+    def _typewriter_boxes(self, text, font_size=30, stroke_width=2):
+        """计算打字机效果中每个字符在文字图片（下采样后）上的显示区域"""
+        layout = self._text_layout(text, font_size, stroke_width)
+        font = layout["font"]
+        draw = layout["draw"]
+        sw = layout["stroke_width"]
+        scale_factor = layout["scale_factor"]
+        x, y = layout["origin"]
+        width = int(layout["canvas_size"][0] // scale_factor)
+        height = int(layout["canvas_size"][1] // scale_factor)
+
+        # 与Pillow多行文字的行距计算保持一致（默认行间距为4）
+        lines = text.split("\n")
+        line_spacing = draw.textbbox((0, 0), "A", font=font, stroke_width=sw)[3]
+        line_spacing += sw + 4
+
+        def line_ink(k):
+            top = y + k * line_spacing
+            if not lines[k]:
+                return top, top + line_spacing
+            bbox = draw.textbbox((x, top), lines[k], font=font, stroke_width=sw)
+            return bbox[1], bbox[3]
+
+        # 行与行的分界取上一行文字底部与下一行文字顶部的中点
+        row_bounds = [0]
+        for k in range(1, len(lines)):
+            prev_bottom = line_ink(k - 1)[1]
+            next_top = line_ink(k)[0]
+            row_bounds.append(int(round((prev_bottom + next_top) / 2 / scale_factor)))
+        row_bounds.append(height)
+
+        boxes = []
+        for k, line in enumerate(lines):
+            if k > 0:
+                boxes.append(None)  # 换行符本身不占显示区域
+            left = 0
+            for j in range(len(line)):
+                if j == len(line) - 1:
+                    right = width
+                else:
+                    advance = draw.textlength(line[: j + 1], font=font)
+                    right = int(round((x + advance) / scale_factor))
+                boxes.append((left, row_bounds[k], right, row_bounds[k + 1]))
+                left = right
+        return boxes
 
+    @timed("overlay_build")
     def add_text(
         self,
         text,
@@ -170,34 +307,12 @@ class VideoEditor:
         typing_speed=0.1,
         center_on_last_image=False,
         rotation_angle=0,
-        stroke_width=None,
+        stroke_width=0,
     ):
-        """添加中文文本到视频"""
+        """添加中文文本到视频（换行由调用方处理，见 layout_plan.wrap_text）"""
         if end_time is None:
             end_time = self.video.duration
 
-        # 根据文字位置决定是否使用描边效果和自动换行
-        if stroke_width is None:
-            use_stroke = position[1] == 967 if isinstance(position, tuple) else False
-            stroke_width = 2 if use_stroke else 0
-
-        # 处理左侧评论和底部评论的自动换行（y坐标为410或1080时）
-        if isinstance(position, tuple) and position[1] in [410, 1080]:
-            chars_per_line = 16 if position[1] == 410 else 31
-            # 先处理用户手动换行
-            lines = text.split("\n")
-            formatted_lines = []
-
-            # 处理每一行，如果超过最大长度则自动换行
-            for line in lines:
-                while len(line) > chars_per_line:
-                    formatted_lines.append(line[:chars_per_line])
-                    line = line[chars_per_line:]
-                if line:  # 添加剩余的文字
-                    formatted_lines.append(line)
-
-            text = "\n".join(formatted_lines)
-
         # 创建文字图片
         text_image = self.create_text_image(
             text, font_size, color, stroke_width=stroke_width
@@ -218,33 +333,30 @@ class VideoEditor:
 
         actual_position = self._calculate_position(position, text_width, text_height)
 
-        # 优化打字机效果的实现
+        # 打字机效果：整段文字只渲染一次，按时间逐字显示
         if typewriter_effect:
-            # 预先创建所有字符的图片
-            text_clips = []
-            for i in range(len(text)):
-                current_text = text[: i + 1]
-                text_image = self.create_text_image(current_text, font_size, color)
-                text_clip = ImageClip(np.array(text_image), transparent=True)
-                if rotation_angle != 0:
-                    text_clip = text_clip.rotate(
-                        rotation_angle, resample="bilinear", expand=True
-                    )
-                clip_start = start_time + i * typing_speed
-                text_clip = (
-                    text_clip.set_position(actual_position)
-                    .set_start(clip_start)
-                    .set_end(end_time)
-                )
-                text_clips.append(text_clip)
-            self.overlays.extend(text_clips)
+            boxes = self._typewriter_boxes(text, font_size, stroke_width)
+            text_clip = TypewriterClip(
+                text_image,
+                boxes,
+                typing_speed,
+                duration=end_time - start_time,
+                rotation_angle=rotation_angle,
+            )
+            text_clip = (
+                text_clip.set_position(actual_position)
+                .set_start(start_time)
+                .set_end(end_time)
+            )
+            self.overlays.append(text_clip)
         else:
             # 非打字机效果直接添加一个文字clip
-            text_clip = ImageClip(np.array(text_image), transparent=True)
             if rotation_angle != 0:
-                text_clip = text_clip.rotate(
-                    rotation_angle, resample="bilinear", expand=True
+                # 旋转只做一次，避免MoviePy的rotate在每一帧重复旋转
+                text_image = text_image.rotate(
+                    rotation_angle, resample=Image.BILINEAR, expand=True
                 )
+            text_clip = ImageClip(np.array(text_image), transparent=True)
             text_clip = (
                 text_clip.set_position(actual_position)
                 .set_start(start_time)
@@ -252,11 +364,11 @@ class VideoEditor:
             )
             self.overlays.append(text_clip)
 
+    @timed("overlay_build")
     def add_image(self, image_path, position, size=None, start_time=0, end_time=None):
         if end_time is None:
             end_time = self.video.duration
 
-        img_clip = ImageClip(image_path)
         actual_position = self._calculate_position(position)
 
         if size:
@@ -265,13 +377,12 @@ class VideoEditor:
                 w = int(float(w[:-1]) * self.width / 100)
             if isinstance(h, str) and h.endswith("%"):
                 h = int(float(h[:-1]) * self.height / 100)
+            # height为None时由素材缓存根据width保持原始宽高比
+            size = (w, h)
 
-            # 如果height为None，根据width保持原始宽高比
-            if h is None:
-                aspect_ratio = img_clip.size[1] / img_clip.size[0]
-                h = int(w * aspect_ratio)
-
-            img_clip = img_clip.resize((w, h))
+        # 图片像素来自进程内的素材缓存（已解码并缩放好的只读数组）
+        with self.timer.stage("asset_load"):
+            img_clip = asset_store.clip(image_path, size)
 
         # 获取图片尺寸
         self.last_image_size = img_clip.size
@@ -284,6 +395,7 @@ class VideoEditor:
         )
         self.overlays.append(img_clip)
 
+    @timed("cleanup")
     def cleanup(self):
         """清理所有视频相关资源"""
         try:
@@ -293,11 +405,13 @@ class VideoEditor:
                     clip.close()
             self.overlays.clear()
 
-            # 清理视频和音频
-            if hasattr(self, "video"):
+            # 清理视频（共享的模板由调用方关闭）
+            if hasattr(self, "video") and self._owns_video:
                 self.video.close()
-            if hasattr(self, "audio"):
-                self.audio.close()
+            if self.frame_cache is not None:
+                self.timer.count("frame_cache_hits", self.frame_cache.hits)
+                self.frame_cache.hits = 0
+                self.frame_cache.clear()
 
             # 手动触发垃圾回收
             import gc
@@ -307,98 +421,91 @@ class VideoEditor:
         except Exception as e:
             self.logger.error(f"清理资源时出错: {str(e)}")
 
-    def render(self, output_path):
-        """渲染并保存视频"""
-        try:
-            self.logger.info(f"开始渲染视频到: {output_path}")
-            # 计算所需的总时长（基于所有叠加层的最大结束时间）
-            max_duration = (
-                max(clip.end for clip in self.overlays)
-                if self.overlays
-                else self.video.duration
+    def timeline_duration(self):
+        """计算所需的总时长（基于所有叠加层的最大结束时间）"""
+        return (
+            max(clip.end for clip in self.overlays)
+            if self.overlays
+            else self.video.duration
+        )
+
+    def output_duration(self):
+        """输出视频的时长（不短于模板视频）"""
+        return max(self.timeline_duration(), self.video.duration)
+
+    @timed("composite")
+    def _build_composite(self, max_duration):
+        """构建最终合成clip（不含音频，音轨在写入时直接复用预编码的AAC）"""
+        # 合并起止时间相同的静态叠加层，每帧只需混合一次
+        overlays = flatten_overlays(self.overlays, (self.width, self.height))
+        self.logger.debug(f"叠加层合并: {len(self.overlays)} -> {len(overlays)}")
+
+        # 如果原始视频时长小于所需时长，创建循环播放的视频
+        video = self.video
+        if max_duration > video.duration:
+            self.logger.info(
+                f"需要循环播放视频: 原始时长{video.duration}秒, 目标时长{max_duration}秒"
             )
+            # 创建循环视频并裁剪到所需时长
+            video = self._loop(video, max_duration)
+        else:
+            self.logger.info("使用原始视频时长")
+        # 叠加层在预先分配的画面缓冲区中以整数运算原地混合
+        compositor = Compositor(video, overlays, (self.width, self.height))
+        return VideoClip(make_frame=compositor.frame, duration=video.duration)
+
+    def _write_options(self):
+        """write_videofile使用的编码参数（编码器、预设、码率控制和线程数由编码配置决定）"""
+        return dict(
+            fps=24,  # 降低帧率
+            write_logfile=False,
+            verbose=False,
+            # 不输出进度条，已写入的帧数作为任务进度上报
+            logger=FrameProgressLogger(),
+            **moviepy_options(self.encoder_profile),
+        )
+
+    def render(self, output_path, backend="moviepy"):
+        """渲染并保存视频
+
+        backend为"moviepy"时逐帧在Python中合成；为"ffmpeg"时把叠加层
+        转换为filter_complex，由单个ffmpeg进程完成合成和编码。
+        """
+        if backend not in self.RENDER_BACKENDS:
+            raise ValueError(f"不支持的渲染方式: {backend}")
+        try:
+            self.logger.info(f"开始渲染视频到: {output_path}（{backend}）")
+            max_duration = self.timeline_duration()
             self.logger.debug(f"计算的视频总时长: {max_duration}秒")
 
-            # 如果原始视频时长小于所需时长，创建循环播放的视频
-            if max_duration > self.video.duration:
-                self.logger.info(
-                    f"需要循环播放视频: 原始时长{self.video.duration}秒, 目标时长{max_duration}秒"
-                )
-                # 计算需要循环的次数（向上取整）
-                loop_count = int(max_duration / self.video.duration) + 1
-                # 创建循环视频
-                looped_video = self.video.loop(n=loop_count)
-                # 裁剪到所需时长
-                looped_video = looped_video.subclip(0, max_duration)
-                # 循环并裁剪音频以匹配视频时长
-                if max_duration > self.audio.duration:
-                    # 计算音频需要循环的次数
-                    audio_loop_count = int(max_duration / self.audio.duration) + 1
-                    # 创建一个足够长的音频片段
-                    looped_audio = concatenate_audioclips(
-                        [self.audio] * audio_loop_count
-                    )
-                else:
-                    looped_audio = self.audio
-                # 裁剪音频到目标时长
-                looped_audio = looped_audio.subclip(0, max_duration)
-                looped_video = looped_video.set_audio(looped_audio)
-                final_video = CompositeVideoClip([looped_video] + self.overlays)
-            else:
-                self.logger.info("使用原始视频时长")
-                # 确保音频长度足够
-                if self.video.duration > self.audio.duration:
-                    # 计算音频需要循环的次数
-                    audio_loop_count = (
-                        int(self.video.duration / self.audio.duration) + 1
-                    )
-                    # 创建一个足够长的音频片段
-                    video_audio = concatenate_audioclips(
-                        [self.audio] * audio_loop_count
-                    )
-                else:
-                    video_audio = self.audio
-                # 裁剪音频以匹配视频时长
-                video_audio = video_audio.subclip(0, self.video.duration)
-                video_with_audio = self.video.set_audio(video_audio)
-                final_video = CompositeVideoClip([video_with_audio] + self.overlays)
+            self.timer.count("overlays", len(self.overlays))
 
-            # 确保日志目录存在
-            log_dir = "src/log"
-            os.makedirs(log_dir, exist_ok=True)
-            log_file = os.path.join(log_dir, "render.log")
+            if backend == "ffmpeg":
+                with self.timer.stage("encode"):
+                    FFmpegRenderer(self).render(output_path, max_duration)
+                self.timer.count("frames", int(round(max_duration * 24)))
+                self.timer.count("bytes_written", os.path.getsize(output_path))
+                self.cleanup()
+                self.logger.info("视频渲染完成")
+                return
+
+            final_video = self._build_composite(max_duration)
 
             # 设置优化参数
             self.logger.info("开始写入视频文件，使用优化参数")
-            final_video.write_videofile(
-                output_path,
-                codec="h264_nvenc" if self._has_cuda() else "libx264",
-                audio_codec="aac",
-                preset=(
-                    "p2" if self._has_cuda() else "veryfast"
-                ),  # 降低编码质量以提升速度
-                threads=16,  # 增加编码线程数
-                bitrate="1500k",  # 降低比特率
-                fps=24,  # 降低帧率
-                write_logfile=False,
-                temp_audiofile=False,
-                remove_temp=True,
-                # 优化编码参数
-                ffmpeg_params=[
-                    "-tune",
-                    "zerolatency",  # 优化编码延迟
-                    "-movflags",
-                    "+faststart",  # 优化视频加载速度
-                    "-bf",
-                    "1",  # 减少B帧数量
-                    "-g",
-                    "24",  # 设置关键帧间隔为1秒
-                    "-sc_threshold",
-                    "0",  # 禁用场景切换检测
-                ],
-                audio_fps=44100,
-                verbose=False,
+            fd, audio_path = tempfile.mkstemp(
+                suffix=".m4a", dir=os.path.dirname(os.path.abspath(output_path))
             )
+            os.close(fd)
+            try:
+                with self.timer.stage("audio"):
+                    audio_track(self.audio_path, final_video.duration, audio_path)
+                # 音轨作为ffmpeg的第二个输入直接复制，不需要解码和重新编码
+                self._write_video(
+                    final_video, output_path, audio=audio_path, **self._write_options()
+                )
+            finally:
+                os.remove(audio_path)
             final_video.close()
             self.cleanup()  # 确保在渲染后调用清理方法
             self.logger.info("视频渲染完成")
@@ -406,11 +513,103 @@ class VideoEditor:
             self.logger.error(f"渲染视频时出错: {str(e)}")
             raise
 
-    def _has_cuda(self):
-        """检查是否支持CUDA"""
+    @staticmethod
+    def render_batch(editors, output_paths):
+        """用一个ffmpeg进程同时渲染多个使用相同模板和背景音乐的视频
+
+        整组的编码耗时计入第一个editor的encode阶段，结束后清理全部editor。
+        """
+        try:
+            for editor in editors:
+                editor.timer.count("overlays", len(editor.overlays))
+            with editors[0].timer.stage("encode"):
+                render_batch(editors, output_paths)
+            for editor, output_path in zip(editors, output_paths):
+                editor.timer.count("frames", int(round(editor.timeline_duration() * 24)))
+                editor.timer.count("bytes_written", os.path.getsize(output_path))
+        finally:
+            for editor in editors:
+                editor.cleanup()
+
+    def render_segment(self, output_path, start, end):
+        """只渲染时间轴上[start, end)区间的画面（不含音频），用于分段并行编码"""
+        try:
+            self.logger.info(f"开始渲染视频分段 {start}-{end}秒 到: {output_path}")
+            final_video = self._build_composite(self.timeline_duration())
+            segment = final_video.subclip(start, min(end, final_video.duration))
+            self._write_video(segment, output_path, audio=False, **self._write_options())
+            final_video.close()
+            self.cleanup()
+        except Exception as e:
+            self.logger.error(f"渲染视频分段时出错: {str(e)}")
+            raise
+
+    def preview_time(self):
+        """预览画面的时间点：所有叠加层都已出现、打字机文字已全部显示的最早时刻"""
+        t = 0
+        for clip in self.overlays:
+            shown = clip.start
+            if isinstance(clip, TypewriterClip) and clip.step_times:
+                shown += clip.step_times[-1]
+            t = max(t, shown)
+        # 不超过时间轴的最后一帧
+        return min(t, max(0, self.timeline_duration() - 1.0 / 24))
+
+    def render_preview(self, output_path, kind="still"):
+        """渲染预览，与完整渲染使用相同的叠加层
+
+        kind为"still"时保存一张JPEG（见 preview_time）；为"clip"时输出
+        低帧率、无音频、最长 PREVIEW_CLIP_SECONDS 秒的短视频，editor需按
+        缩小后的版式创建（见 RenderPlan.scaled），直接以低分辨率解码和合成。
+        """
+        if kind not in self.PREVIEW_KINDS:
+            raise ValueError(f"不支持的预览方式: {kind}")
         try:
-            import torch
+            self.logger.info(f"开始渲染预览到: {output_path}（{kind}）")
+            self.timer.count("overlays", len(self.overlays))
+            if kind == "still":
+                final_video = self._build_composite(self.timeline_duration())
+                with self.timer.stage("composite"):
+                    frame = final_video.get_frame(self.preview_time())
+                with self.timer.stage("encode"):
+                    Image.fromarray(frame).save(output_path, quality=85)
+                self.timer.count("frames", 1)
+                self.timer.count("bytes_written", os.path.getsize(output_path))
+            else:
+                duration = min(self.timeline_duration(), self.PREVIEW_CLIP_SECONDS)
+                final_video = self._build_composite(duration)
+                options = dict(
+                    self._write_options(), fps=self.PREVIEW_FPS, **moviepy_options("preview")
+                )
+                self._write_video(
+                    final_video.subclip(0, min(duration, final_video.duration)),
+                    output_path,
+                    audio=False,
+                    **options,
+                )
+            final_video.close()
+            self.cleanup()
+            self.logger.info("预览渲染完成")
+        except Exception as e:
+            self.logger.error(f"渲染预览时出错: {str(e)}")
+            raise
+
+    def _write_video(self, clip, output_path, **options):
+        """写入视频文件，逐帧合成计入composite阶段，其余计入encode阶段"""
+        get_frame = clip.get_frame
+
+        def timed_get_frame(t):
+            with self.timer.stage("composite"):
+                return get_frame(t)
+
+        clip.get_frame = timed_get_frame
+        with self.timer.stage("encode"):
+            clip.write_videofile(output_path, **options)
+        self.timer.count("frames", int(round(clip.duration * options["fps"])))
+        self.timer.count("bytes_written", os.path.getsize(output_path))
+
+    def write_audio(self, output_path):
+        """截取与输出视频等长的背景音轨，供分段渲染合并时使用"""
+        with self.timer.stage("audio"):
+            audio_track(self.audio_path, self.output_duration(), output_path)
 
-            return torch.cuda.is_available()
-        except ImportError:
-            return False